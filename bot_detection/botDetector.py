@@ -1,97 +1,324 @@
-import praw
+import asyncio
+import httpx
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
-import os
 import numpy as np
 import time
-from datetime import datetime
 from collections import Counter
 import math
 import re
-from difflib import SequenceMatcher
+import hashlib
+import json
+import sqlite3
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; run the kernels as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
 
 
 load_dotenv()
 
 # --- Reddit API setup ---
-reddit = praw.Reddit(
-    client_id=os.getenv("CLIENT_ID"),
-    client_secret=os.getenv("CLIENT_SECRET"),
-    user_agent="bot detection unwrapathon"
-)
+REDDIT_BASE_URL = "https://www.reddit.com"
+USER_AGENT = "python:bot-detection-unwrapathon:v1.0 (by u/SilveerDusk)"
+
+# Reddit allows ~60 requests per minute per client
+_rate_limiter = AsyncLimiter(60, 60)
+
+# Recently fetched users: username.lower() -> (fetched_at, user_data or None)
+USER_CACHE_TTL = 300  # seconds
+USER_CACHE_MAXSIZE = 10_000
+_user_cache = {}
+
+# Scores persisted across runs, reused while the user has no new activity
+BOT_CACHE_PATH = "botcache.db"
+BOT_CACHE_MAX_AGE = 24 * 60 * 60  # seconds
+_bot_cache_conn = None
+
+
+def reddit_client():
+    """HTTP client for Reddit's public JSON endpoints. Must be used inside a running event loop."""
+    return httpx.AsyncClient(
+        base_url=REDDIT_BASE_URL,
+        headers={"User-Agent": USER_AGENT},
+        timeout=10.0,
+        follow_redirects=True,
+    )
+
+
+async def _get_json(client, path, params=None):
+    """GET a Reddit JSON endpoint; None if the resource is missing or forbidden."""
+    async with _rate_limiter:
+        resp = await client.get(path, params=params)
+    if resp.status_code in (403, 404):
+        return None
+    resp.raise_for_status()
+    return resp.json()
+
+
+def _cache_lookup(username):
+    entry = _user_cache.get(username.lower())
+    if entry is not None and time.monotonic() - entry[0] < USER_CACHE_TTL:
+        return entry
+    return None
+
+
+def _cache_store(username, user_data):
+    key = username.lower()
+    _user_cache.pop(key, None)
+    if len(_user_cache) >= USER_CACHE_MAXSIZE:
+        # dicts keep insertion order, so this drops the oldest entry
+        _user_cache.pop(next(iter(_user_cache)))
+    _user_cache[key] = (time.monotonic(), user_data)
+    return user_data
+
+
+def _bot_cache():
+    global _bot_cache_conn
+    if _bot_cache_conn is None:
+        _bot_cache_conn = sqlite3.connect(BOT_CACHE_PATH)
+        _bot_cache_conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "username TEXT PRIMARY KEY, latest_created REAL, features BLOB, "
+            "score REAL, fetched_at REAL)"
+        )
+    return _bot_cache_conn
+
+
+def _score_cache_get(username):
+    """Return (latest_created, score) if a recent score is stored, else None."""
+    row = _bot_cache().execute(
+        "SELECT latest_created, score, fetched_at FROM scores WHERE username = ?",
+        (username.lower(),),
+    ).fetchone()
+    if row is None or time.time() - row[2] > BOT_CACHE_MAX_AGE:
+        return None
+    return row[0], row[1]
 
-from prawcore.exceptions import NotFound, Forbidden, PrawcoreException
 
-def fetch_user_data_safe(username, limit=50):
-    """Fetch user data; return None if user doesn't exist, suspended, or private."""
+def _score_cache_put(username, latest_created, features, score):
+    conn = _bot_cache()
+    conn.execute(
+        "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?)",
+        (username.lower(), latest_created, json.dumps(features), score, time.time()),
+    )
+    conn.commit()
+
+
+async def fetch_latest_activity(client, username):
+    """Timestamp of the user's newest post or comment (0.0 if none); None on failure."""
+    base = f"/user/{username}"
     try:
-        user = reddit.redditor(username)
-        created = user.created_utc  # triggers actual fetch
-        user_data = {
-            "username": username,
-            "created_utc": created,
-            "link_karma": user.link_karma,
-            "comment_karma": user.comment_karma,
-            "posts": [],
-            "comments": []
-        }
-
-        for post in user.submissions.new(limit=limit):
-            user_data["posts"].append({
-                "created_utc": post.created_utc,
-                "subreddit": str(post.subreddit),
-                "score": post.score,
-                "title": post.title,
-                "selftext": post.selftext
-            })
-        for com in user.comments.new(limit=limit):
-            user_data["comments"].append({
-                "created_utc": com.created_utc,
-                "subreddit": str(com.subreddit),
-                "score": com.score,
-                "body": com.body
-            })
-        return user_data
-
-    except (NotFound, Forbidden):
-        # user doesn't exist or suspended/private
+        submitted, commented = await asyncio.gather(
+            _get_json(client, f"{base}/submitted.json", {"limit": 1}),
+            _get_json(client, f"{base}/comments.json", {"limit": 1}),
+        )
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"[WARN] Could not fetch {username}: {e}")
+        return None
+    if submitted is None or commented is None:
         return None
-    except PrawcoreException as e:
+    children = submitted["data"]["children"] + commented["data"]["children"]
+    return max((child["data"]["created_utc"] for child in children), default=0.0)
+
+
+async def fetch_user_data_safe(client, username, limit=50):
+    """Fetch user data; return None if user doesn't exist, suspended, or private.
+
+    Results (including missing users) are cached for USER_CACHE_TTL seconds.
+    """
+    cached = _cache_lookup(username)
+    if cached is not None:
+        return cached[1]
+
+    base = f"/user/{username}"
+    try:
+        about, submitted, commented = await asyncio.gather(
+            _get_json(client, f"{base}/about.json"),
+            _get_json(client, f"{base}/submitted.json", {"limit": limit}),
+            _get_json(client, f"{base}/comments.json", {"limit": limit}),
+        )
+    except (httpx.HTTPError, ValueError) as e:
         print(f"[WARN] Could not fetch {username}: {e}")
         return None
 
+    # Suspended accounts still answer about.json, but without account details
+    if about is None or submitted is None or commented is None or "created_utc" not in about["data"]:
+        # user doesn't exist or suspended/private
+        return _cache_store(username, None)
+
+    user = about["data"]
+    user_data = {
+        "username": username,
+        "created_utc": user["created_utc"],
+        "link_karma": user.get("link_karma", 0),
+        "comment_karma": user.get("comment_karma", 0),
+    }
+
+    # Store posts/comments column-wise: every feature reads one attribute
+    # across all rows, so flat arrays/lists beat a list of per-row dicts
+    posts = [child["data"] for child in submitted["data"]["children"]]
+    comments = [child["data"] for child in commented["data"]["children"]]
+
+    post_times = np.empty(len(posts), dtype=np.float64)
+    post_scores = np.empty(len(posts), dtype=np.int64)
+    for i, post in enumerate(posts):
+        post_times[i] = post["created_utc"]
+        post_scores[i] = post["score"]
+    user_data["posts"] = {
+        "created_utc": post_times,
+        "subreddit": [post["subreddit"] for post in posts],
+        "score": post_scores,
+        "title": [post["title"] for post in posts],
+        "selftext": [post.get("selftext", "") for post in posts],
+    }
+
+    comment_times = np.empty(len(comments), dtype=np.float64)
+    comment_scores = np.empty(len(comments), dtype=np.int64)
+    for i, com in enumerate(comments):
+        comment_times[i] = com["created_utc"]
+        comment_scores[i] = com["score"]
+    user_data["comments"] = {
+        "created_utc": comment_times,
+        "subreddit": [com["subreddit"] for com in comments],
+        "score": comment_scores,
+        "body": [com["body"] for com in comments],
+    }
+    return _cache_store(username, user_data)
+
+
+_URL_RE = re.compile(r'http\S+|www\S+')
+_PUNCT_RE = re.compile(r'[^a-z0-9\s]')
+_WS_RE = re.compile(r'\s+')
+
 
 def clean_text(text: str) -> str:
     """Basic text normalization for Reddit posts/comments."""
-    # Lowercase everything
-    text = text.lower()
-    # Remove URLs
-    text = re.sub(r'http\S+|www\S+', '', text)
-    # Remove punctuation and extra whitespace
-    text = re.sub(r'[^a-z0-9\s]', '', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
-
-def get_duplicate_content_ratio(items, content_key):
+    # Lowercase, remove URLs, then punctuation, then collapse whitespace
+    return _WS_RE.sub(' ', _PUNCT_RE.sub('', _URL_RE.sub('', text.lower()))).strip()
+
+# --- MinHash setup for near-duplicate detection ---
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 128
+_rng = np.random.default_rng(42)
+# (a * x + b) mod 2**64 with odd a is a permutation of the uint64 hash space
+_PERM_A = _rng.integers(0, np.iinfo(np.uint64).max, size=NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, np.iinfo(np.uint64).max, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """Hash every character 5-gram of the text to a 64-bit integer."""
+    if len(text) < SHINGLE_SIZE:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """MinHash signature (uint64[128]) of the text's shingle set."""
+    return _minhash(shingle_hashes(text))
+
+
+def _minhash(hashes: np.ndarray) -> np.ndarray:
+    return np.minimum.reduce(hashes[:, None] * _PERM_A + _PERM_B, axis=0)
+
+
+_STOP = frozenset({
+    "a", "an", "the", "and", "or", "but", "is", "are", "was", "were", "be",
+    "to", "of", "in", "on", "at", "for", "with", "it", "this", "that",
+    "i", "you", "me", "my", "your", "so", "just", "im",
+})
+
+
+def canonical_key(text):
+    """Reduce cleaned text to a sorted tuple of 4-char word stems."""
+    key = tuple(sorted(w[:4] for w in text.split() if w not in _STOP))
+    return key or (text,)
+
+
+def get_duplicate_content_ratio(raw_texts):
     """Compute ratio of near-duplicate comments/titles (0–1)."""
-    texts = []
-    for item in items:
-        if isinstance(item, dict) and content_key in item:
-            text = item[content_key]
-            if text and text.strip():
-                texts.append(clean_text(text))
+    texts = [clean_text(text) for text in raw_texts if text and text.strip()]
     
     if len(texts) < 3:
         return 0.0
     
-    sim_scores = []
-    for i in range(len(texts)):
-        for j in range(i+1, len(texts)):
-            sim = SequenceMatcher(None, texts[i], texts[j]).ratio()
-            if sim > 0.8:  # consider "Thank you" and "Thanks!" same
-                sim_scores.append(1)
-            else:
-                sim_scores.append(0)
-    return sum(sim_scores) / max(len(sim_scores), 1)
+    # Bots mostly repeat the same short reply, so bucket texts by canonical
+    # key first: every pair inside a bucket is a duplicate for free, and
+    # only one representative per bucket goes through MinHash
+    groups = Counter()
+    representatives = {}
+    for text in texts:
+        key = canonical_key(text)
+        groups[key] += 1
+        representatives.setdefault(key, text)
+
+    counts = np.fromiter(groups.values(), dtype=np.float64, count=len(groups))
+    duplicate_pairs = float(np.sum(counts * (counts - 1) / 2))
+
+    if len(groups) > 1:
+        hashes = [shingle_hashes(representatives[k]) for k in groups]
+        sizes = np.array([len(h) for h in hashes], dtype=np.float64)
+        # Jaccard(A, B) <= min(|A|, |B|) / max(|A|, |B|), so pairs whose shingle
+        # sets differ too much in size can never clear the threshold
+        i, j = np.triu_indices(len(groups), k=1)
+        candidates = np.minimum(sizes[i], sizes[j]) > 0.8 * np.maximum(sizes[i], sizes[j])
+        i, j = i[candidates], j[candidates]
+        if len(i):
+            # Fraction of agreeing MinHash lanes estimates the Jaccard similarity
+            # of the two shingle sets
+            signatures = np.stack([_minhash(h) for h in hashes])
+            similarity = (signatures[i] == signatures[j]).mean(axis=-1)
+            similar = similarity > 0.8
+            duplicate_pairs += float(np.sum(counts[i[similar]] * counts[j[similar]]))
+
+    total_pairs = len(texts) * (len(texts) - 1) / 2
+    return duplicate_pairs / total_pairs
+
+
+@njit(cache=True)
+def _numeric_features(post_times, comment_times, total_karma, age_days):
+    """Purely numeric features; returns float64[4] of
+    (comment_to_post, activity_spike, post_to_karma, posts_per_day) scores."""
+    num_posts = len(post_times)
+    num_comments = len(comment_times)
+    out = np.zeros(4, dtype=np.float64)
+
+    # --- 2. Comment-to-post ratio ---
+    c_to_p = num_comments / (num_posts + 1e-6)
+    # Extremely low comment activity is bot-like
+    if c_to_p < 1:
+        out[0] = 1 - c_to_p
+
+    # --- 4. Activity spikes ---
+    if num_posts + num_comments > 5:
+        times = np.concatenate((post_times, comment_times))
+        times.sort()
+        deltas = np.diff(times)
+        mean_gap = deltas.mean()
+        # A long quiet gap immediately followed by a burst
+        if np.any((deltas[:-1] > mean_gap * 5) & (deltas[1:] < mean_gap / 5)):
+            out[1] = 1.0
+
+    # --- 5. Post-to-karma ratio ---
+    post_to_karma_ratio = max(num_posts, 1) / (total_karma + 1e-6)
+    # High ratio = suspicious
+    out[2] = min(post_to_karma_ratio * 10, 1.0)
+
+    # --- 7. Posting frequency ---
+    posts_per_day = (num_posts + num_comments) / min(age_days, 30.0)
+    # 0 = inactive, 1 = posting a ton
+    out[3] = min(posts_per_day / 20, 1.0)
+    return out
 
 
 def compute_features(user_data):
@@ -103,46 +330,27 @@ def compute_features(user_data):
 
     # --- 1. Account age ---
     # Younger = more bot-like, with exponential decay over ~6 months
-    age_score = np.exp(-age_days / 180)  # 1.0 new, ~0.03 at 1 year
+    age_score = math.exp(-age_days / 180)  # 1.0 new, ~0.03 at 1 year
 
-    # --- 2. Comment-to-post ratio ---
-    c_to_p = len(comments) / (len(posts) + 1e-6)
-    # Extremely low comment activity is bot-like
-    comment_to_post_score = 1 - min(1.0, c_to_p) if c_to_p < 1 else 0.0
+    # --- 2, 4, 5, 7. Numeric features (JIT-compiled when numba is installed) ---
+    total_karma = float(user_data["link_karma"] + user_data["comment_karma"])
+    comment_to_post_score, activity_spike_score, post_to_karma_score, posts_per_day_score = (
+        float(v) for v in _numeric_features(
+            posts["created_utc"], comments["created_utc"], total_karma, age_days
+        )
+    )
 
     # --- 3. Subreddit diversity ---
-    subreddits = [p["subreddit"] for p in posts] + [c["subreddit"] for c in comments]
-    subreddit_count = len(set(subreddits))
+    subreddit_count = len(set(posts["subreddit"]).union(comments["subreddit"]))
     # Fewer subreddits = more bot-like
     subreddit_diversity_score = 1 - min(subreddit_count / 10, 1.0)  # 1 subreddit → 0.9, 10+ → 0.0
 
-    # --- 4. Activity spikes ---
-    times = sorted([x["created_utc"] for x in posts + comments])
-    activity_spike_score = 0.0
-    if len(times) > 5:
-        deltas = np.diff(times)
-        mean_gap = np.mean(deltas)
-        if np.any((deltas[:-1] > mean_gap * 5) & (deltas[1:] < mean_gap / 5)):
-            activity_spike_score = 1.0
-
-    # --- 5. Post-to-karma ratio ---
-    total_posts = max(len(posts), 1)
-    total_karma = user_data["link_karma"] + user_data["comment_karma"]
-    post_to_karma_ratio = total_posts / (total_karma + 1e-6)
-    # High ratio = suspicious
-    post_to_karma_score = min(post_to_karma_ratio * 10, 1.0)
-
     # --- 6. Duplicate content ---
-    comment_dupe_ratio = get_duplicate_content_ratio(comments, "body")
-    post_dupe_ratio = get_duplicate_content_ratio(posts, "title")
+    comment_dupe_ratio = get_duplicate_content_ratio(comments["body"])
+    post_dupe_ratio = get_duplicate_content_ratio(posts["title"])
     duplicate_content_ratio = max(comment_dupe_ratio, post_dupe_ratio)
     duplicate_content_score = min(duplicate_content_ratio * 5, 1.0)
 
-    # --- 7. Posting frequency ---
-    posts_per_day = (len(posts) + len(comments)) / min(age_days, 30)
-    # 0 = inactive, 1 = posting a ton
-    posts_per_day_score = min(posts_per_day / 20, 1.0)
-
     return {
         "age_score": age_score,
         "age_days": age_days,
@@ -160,7 +368,13 @@ def age_penalty(age_days):
     return 0.25 * math.exp(-age_days / 90)
 
 
+# subreddit_count is a small int (at most 100 posts + comments), so the
+# penalty is a table lookup
+_SR_PENALTY = [0.3 * math.exp(-i / 5) for i in range(128)]
+
 def subreddit_diversity_penalty(subreddit_count):
+    if subreddit_count < len(_SR_PENALTY):
+        return _SR_PENALTY[subreddit_count]
     return 0.3 * math.exp(-subreddit_count / 5)
 
 # --- Heuristic scoring ---
@@ -205,8 +419,10 @@ def compute_bot_score(features):
 
     return min(1.0, score)
 
-def analyze_user(username):
-    data = fetch_user_data_safe(username)
+async def _analyze_user_async(client, username):
+    data = await fetch_user_data_safe(client, username)
+    if data is None:
+        return {"username": username, "bot_score": None, "features": None}
     features = compute_features(data)
     bot_score = compute_bot_score(features)
     return {
@@ -215,16 +431,62 @@ def analyze_user(username):
         "features": features
     }
 
-def generate_bot_score(username):
-    data = fetch_user_data_safe(username)
+
+async def _generate_bot_score_async(client, username):
+    cached = _score_cache_get(username)
+    if cached is not None:
+        # Two limit=1 listings are far cheaper than the full fetch; if nothing
+        # new was posted since the stored score, reuse it
+        latest = await fetch_latest_activity(client, username)
+        if latest is not None and latest == cached[0]:
+            return cached[1]
+
+    data = await fetch_user_data_safe(client, username)
     if data is None:
         return None
     features = compute_features(data)
-    return compute_bot_score(features)
+    score = compute_bot_score(features)
+
+    times = np.concatenate([data["posts"]["created_utc"], data["comments"]["created_utc"]])
+    latest_created = float(times.max()) if len(times) else 0.0
+    _score_cache_put(username, latest_created, features, score)
+    return score
+
+
+async def _run_with_client(coro_fn, *args):
+    async with reddit_client() as client:
+        return await coro_fn(client, *args)
+
+
+def analyze_user(username):
+    return asyncio.run(_run_with_client(_analyze_user_async, username))
+
+
+def generate_bot_score(username):
+    return asyncio.run(_run_with_client(_generate_bot_score_async, username))
+
+
+async def generate_bot_scores(usernames, concurrency=16):
+    """Score many users concurrently over a single client. Returns {username: score}."""
+    # Bound the users in flight so a large sweep doesn't open hundreds of
+    # requests at once; the shared rate limiter still paces the actual calls
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(client, username):
+        async with sem:
+            return username, await _generate_bot_score_async(client, username)
+
+    async with reddit_client() as client:
+        results = await asyncio.gather(*(one(client, u) for u in usernames))
+    return dict(results)
+
 
 if __name__ == "__main__":
     test_user = input("Enter Reddit username to analyze: ")
     result = analyze_user(test_user)
+    if result["bot_score"] is None:
+        print(f"Could not analyze {test_user}: user not found, suspended, or private.")
+        raise SystemExit(1)
     print("\n--- Bot Score Report ---")
     print(f"Username: {result['username']}")
     print(f"Bot Score: {result['bot_score']:.2f}")
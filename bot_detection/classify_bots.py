@@ -3,21 +3,11 @@ import pandas as pd
 import praw
 import sys
 #from botGroundBuilder import analyze_user
-import os 
-from collections import Counter
-import re
-from difflib import SequenceMatcher
-from dotenv import load_dotenv
-
-import re
-
-from sklearn.preprocessing import StandardScaler
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.pipeline import Pipeline
-import pandas as pd
 import os
+from dotenv import load_dotenv
 import time
 import numpy as np
+import itertools
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from db_utils.database import RedditDataManager
@@ -205,14 +195,18 @@ def compute_features_natural(user_data):
     comment_to_post_ratio = total_comments / total_posts
 
     # --- 3. Subreddit diversity (number of unique subreddits) ---
-    subreddits = (
-        [p.subreddit.display_name for p in posts] +
-        [c.subreddit.display_name for c in comments]
+    subreddit_diversity = len(
+        {p.subreddit.display_name for p in posts} |
+        {c.subreddit.display_name for c in comments}
     )
-    subreddit_diversity = len(set(subreddits))
 
     # --- 4. Activity spikes (boolean: 1 = spike detected, 0 = none) ---
-    times = sorted([x.created_utc for x in posts + comments])
+    times = np.fromiter(
+        (x.created_utc for x in itertools.chain(posts, comments)),
+        dtype=np.float64,
+        count=len(posts) + len(comments),
+    )
+    times.sort()
     activity_spike = 0
     if len(times) > 5:
         deltas = np.diff(times)
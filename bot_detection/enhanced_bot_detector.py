@@ -5,66 +5,241 @@ Based on behavioral analysis and pattern recognition
 """
 
 import praw
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from dotenv import load_dotenv
 import os
 import numpy as np
 import time
+from dataclasses import dataclass
+from statistics import median
 from datetime import datetime
-from collections import Counter
 import math
 import json
+import orjson
 import re
-from difflib import SequenceMatcher
+import sys
+import bisect
+import hashlib
+import itertools
+import shelve
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; run the kernels as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+try:
+    from rapidfuzz import fuzz
+except ImportError:  # fall back to MinHash estimates below
+    fuzz = None
 
 load_dotenv()
 
-reddit = praw.Reddit(
-    client_id=os.getenv("CLIENT_ID"),
-    client_secret=os.getenv("CLIENT_SECRET"),
-    user_agent="bot detection unwrapathon"
-)
+# Analysis is network-bound, so users are fetched on a thread pool. Each
+# worker thread gets its own PRAW client: PRAW instances aren't thread-safe
+# and each one paces its own requests.
+MAX_WORKERS = 16
+_thread_local = threading.local()
+
+
+def _pooled_retrying_adapter():
+    # Keep connections alive across requests and retry rate limits / server
+    # errors with backoff (GET only, so nothing is ever submitted twice)
+    retry = Retry(
+        total=5,
+        backoff_factor=1.0,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    return HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retry)
+
+
+def get_reddit():
+    """Return this thread's PRAW client, creating it on first use."""
+    reddit = getattr(_thread_local, "reddit", None)
+    if reddit is None:
+        reddit = praw.Reddit(
+            client_id=os.getenv("CLIENT_ID"),
+            client_secret=os.getenv("CLIENT_SECRET"),
+            user_agent="bot detection unwrapathon"
+        )
+        # prawcore sends everything through this requests.Session
+        reddit._core._requestor._http.mount("https://", _pooled_retrying_adapter())
+        _thread_local.reddit = reddit
+    return reddit
+
+
+# Fetched users are kept on disk for the rest of the clock hour, so repeated
+# scans (and users shared between subreddits) skip the Reddit round trips.
+# Each user has one entry that a refetch overwrites; entries older than a day
+# are deleted when the cache is first opened
+PRAW_CACHE_PATH = ".praw_cache"
+PRAW_CACHE_TTL = 86400
+_cache_lock = threading.Lock()
+_praw_cache = None
+
+
+def _open_praw_cache():
+    """The process-wide shelve, opened (and purged of expired entries) on first use.
+
+    Call with _cache_lock held.
+    """
+    global _praw_cache
+    if _praw_cache is None:
+        _praw_cache = shelve.open(PRAW_CACHE_PATH)
+        atexit.register(_praw_cache.close)
+        now = time.time()
+        expired = []
+        for key in list(_praw_cache.keys()):
+            try:
+                fetched_at, _ = _praw_cache[key]
+            except Exception:  # Unreadable or left over from the old key format
+                fetched_at = 0
+            if not isinstance(fetched_at, (int, float)) or now - fetched_at > PRAW_CACHE_TTL:
+                expired.append(key)
+        for key in expired:
+            del _praw_cache[key]
+    return _praw_cache
+
 
 def fetch_user_data(username, limit=50):
-    """Fetch user metadata, latest posts and comments."""
-    user = reddit.redditor(username)
+    """Fetch user metadata, latest posts and comments (cached per hour)."""
+    key = f"{username.lower()}:{limit}"
+    with _cache_lock:
+        entry = _open_praw_cache().get(key)
+    if entry is not None:
+        fetched_at, user_data = entry
+        now = time.time()
+        if fetched_at // 3600 == now // 3600 and now - fetched_at <= PRAW_CACHE_TTL:
+            return user_data
+
+    user_data = _fetch_user_data_uncached(username, limit)
+
+    with _cache_lock:
+        _open_praw_cache()[key] = (time.time(), user_data)
+    return user_data
+
+
+def _fetch_user_data_uncached(username, limit):
+    # Raw JSON through PRAW's authenticated session: skips building lazy
+    # Redditor/Submission/Comment objects and reads only the fields we use.
+    # Subreddit names repeat heavily across a batch, so they're interned.
+    reddit = get_reddit()
+    about = reddit.request(method="GET", path=f"/user/{username}/about")["data"]
+    submitted = reddit.request(method="GET", path=f"/user/{username}/submitted", params={"limit": limit})
+    commented = reddit.request(method="GET", path=f"/user/{username}/comments", params={"limit": limit})
 
     user_data = {
         "username": username,
-        "created_utc": user.created_utc,
-        "link_karma": user.link_karma,
-        "comment_karma": user.comment_karma,
-        "is_verified": user.verified if hasattr(user, 'verified') else False,
+        "created_utc": about["created_utc"],
+        "link_karma": about.get("link_karma", 0),
+        "comment_karma": about.get("comment_karma", 0),
+        "is_verified": about.get("verified", False),
         "posts": [],
         "comments": []
     }
 
-    for post in user.submissions.new(limit=limit):
+    for child in submitted["data"]["children"]:
+        post = child["data"]
         user_data["posts"].append({
-            "created_utc": post.created_utc,
-            "subreddit": str(post.subreddit),
-            "score": post.score,
-            "title": post.title,
-            "selftext": post.selftext
+            "created_utc": post["created_utc"],
+            "subreddit": sys.intern(post["subreddit"]),
+            "score": post["score"],
+            "title": post["title"],
+            "selftext": post.get("selftext", "")
         })
     
-    for com in user.comments.new(limit=limit):
+    for child in commented["data"]["children"]:
+        com = child["data"]
         user_data["comments"].append({
-            "created_utc": com.created_utc,
-            "subreddit": str(com.subreddit),
-            "score": com.score,
-            "body": com.body
+            "created_utc": com["created_utc"],
+            "subreddit": sys.intern(com["subreddit"]),
+            "score": com["score"],
+            "body": com["body"]
         })
     
     return user_data
 
 
+_URL_RE = re.compile(r'http\S+|www\S+')
+_PUNCT_RE = re.compile(r'[^a-z0-9\s]')
+# Deletes every ASCII character that isn't a lowercase letter, digit or whitespace
+_ASCII_PUNCT_TABLE = str.maketrans('', '', ''.join(
+    c for c in map(chr, range(128)) if not (c.isdigit() or c.isspace() or 'a' <= c <= 'z')
+))
+
 def clean_text(text: str) -> str:
     """Basic text normalization for Reddit posts/comments."""
-    text = text.lower()
-    text = re.sub(r'http\S+|www\S+', '', text)
-    text = re.sub(r'[^a-z0-9\s]', '', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+    text = _URL_RE.sub('', text.lower())
+    if text.isascii():
+        text = text.translate(_ASCII_PUNCT_TABLE)
+    else:
+        text = _PUNCT_RE.sub('', text)
+    return ' '.join(text.split())
+
+
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 128
+DUPLICATE_JACCARD = 0.5  # roughly SequenceMatcher ratio > 0.8 on short texts
+MINHASH_SLACK = 0.1  # estimates this far below the threshold still get an exact check
+# At this many texts, pairwise work switches to 64-bit SimHash. Posts and
+# comments are scored separately, and fetch_user_data's default limit=50 caps
+# each at 50 texts (1,225 pairs, cheap on the exact path). So this branch only
+# runs for callers that raise limit; below it the exact ratio is worth keeping
+SIMHASH_MIN_TEXTS = 200
+SIMHASH_MAX_DISTANCE = 3
+_rng = np.random.default_rng(42)
+# Random affine hashes h(x) = a*x + b (mod 2**64); odd a keeps each one a bijection
+_PERM_A = _rng.integers(0, np.iinfo(np.uint64).max, size=NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, np.iinfo(np.uint64).max, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def _shingles(text):
+    """Set of the text's character 5-grams."""
+    if len(text) < SHINGLE_SIZE:
+        return frozenset((text,))
+    return frozenset(text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1))
+
+
+def _shingle_hashes(shingles):
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+
+
+def _minhash(shingles):
+    """MinHash signature (uint64[128]) of a shingle set."""
+    hashes = _shingle_hashes(shingles)
+    return np.minimum.reduce(hashes[:, None] * _PERM_A + _PERM_B, axis=0)
+
+
+def _simhash(shingles):
+    """64-bit SimHash fingerprint: each bit is the majority vote of the shingle hashes."""
+    hashes = _shingle_hashes(shingles)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(hashes)
+    return np.packbits(votes).view(np.uint64)[0]
+
+
+def _simhash_duplicate_ratio(texts, pairs):
+    """Fraction of pairs whose SimHash fingerprints are within SIMHASH_MAX_DISTANCE bits."""
+    fingerprints = np.array([_simhash(_shingles(t)) for t in texts], dtype=np.uint64)
+    i, j = pairs
+    xor = fingerprints[i] ^ fingerprints[j]
+    if hasattr(np, "bitwise_count"):  # NumPy 2.0+
+        distance = np.bitwise_count(xor)
+    else:
+        distance = np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+    return float(np.mean(distance <= SIMHASH_MAX_DISTANCE))
 
 
 def get_duplicate_content_ratio(items, content_key):
@@ -79,89 +254,177 @@ def get_duplicate_content_ratio(items, content_key):
     if len(texts) < 3:
         return 0.0
     
-    duplicate_count = 0
-    total_comparisons = 0
-    
-    for i in range(len(texts)):
-        for j in range(i+1, len(texts)):
-            sim = SequenceMatcher(None, texts[i], texts[j]).ratio()
-            total_comparisons += 1
-            if sim > 0.8:
-                duplicate_count += 1
-    
-    return duplicate_count / max(total_comparisons, 1)
+    pairs = np.triu_indices(len(texts), k=1)
+    if len(texts) >= SIMHASH_MIN_TEXTS:
+        # One 64-bit fingerprint per text makes each pair a single XOR + popcount
+        return _simhash_duplicate_ratio(texts, pairs)
+
+    if fuzz is not None:
+        # fuzz.ratio is 1 - indel_distance / (len_a + len_b), and the distance
+        # is at least the length difference, so 2 * min_len / (len_a + len_b)
+        # bounds the ratio from above. Only pairs that can clear 80 get scored.
+        lengths = np.array([len(t) for t in texts])
+        i, j = pairs
+        shorter = np.minimum(lengths[i], lengths[j])
+        candidates = 2 * shorter >= 0.8 * (lengths[i] + lengths[j])
+        i, j = i[candidates], j[candidates]
+        # Tighter bound (difflib's quick_ratio idea): the longest common
+        # subsequence can't use more of a character than both texts contain.
+        # clean_text leaves only ASCII, so one 128-bin histogram per text.
+        histograms = np.stack([
+            np.bincount(np.frombuffer(t.encode(), dtype=np.uint8), minlength=128) for t in texts
+        ])
+        shared = np.minimum(histograms[i], histograms[j]).sum(axis=1)
+        candidates = 2 * shared >= 0.8 * (lengths[i] + lengths[j])
+        duplicates = sum(
+            1 for a, b in zip(i[candidates], j[candidates])
+            if fuzz.ratio(texts[a], texts[b], score_cutoff=80) > 80
+        )
+        return duplicates / len(pairs[0])
+
+    # Fraction of agreeing MinHash lanes estimates the Jaccard similarity of
+    # the shingle sets, so each pair costs 128 integer compares. The estimate
+    # only picks candidates; their exact Jaccard decides (set ops run in C).
+    shingles = [_shingles(t) for t in texts]
+    signatures = np.stack([_minhash(sh) for sh in shingles])
+    similarity = (signatures[:, None, :] == signatures[None, :, :]).mean(axis=-1)
+    i, j = pairs
+    candidates = similarity[i, j] >= DUPLICATE_JACCARD - MINHASH_SLACK
+
+    duplicates = 0
+    for a, b in zip(i[candidates], j[candidates]):
+        inter = len(shingles[a] & shingles[b])
+        if inter / (len(shingles[a]) + len(shingles[b]) - inter) >= DUPLICATE_JACCARD:
+            duplicates += 1
+    return duplicates / len(i)
+
+
+# Auto-generated username shapes, tried in order in a single regex pass:
+# Word_Word1234, or 8+ letters followed by 4+ digits (any case)
+_GENERATED_USERNAME_RE = re.compile(
+    r'(?P<word_pair>\w+_\w+\d{4})|(?P<letters_digits>(?i:[a-z]{8,}\d{4,}))'
+)
+_GENERATED_USERNAME_SCORES = {"word_pair": 0.5, "letters_digits": 0.7}
 
 
-def compute_features(user_data):
-    """Compute comprehensive features for bot detection."""
-    now = time.time()
-    age_days = (now - user_data["created_utc"]) / (60 * 60 * 24)
-    posts = user_data["posts"]
-    comments = user_data["comments"]
+@njit(cache=True)
+def _numeric_features(times, num_posts, num_comments, total_karma, age_days):
+    """Arithmetic part of compute_features; sorts times in place.
 
+    Returns (age_score, comment_to_post_score, activity_spike_score,
+    post_to_karma_score, posts_per_day_score, avg_karma_per_post).
+    """
     age_score = np.exp(-age_days / 180)
 
-    c_to_p = len(comments) / (len(posts) + 1e-6)
+    c_to_p = num_comments / (num_posts + 1e-6)
     comment_to_post_score = 1 - min(1.0, c_to_p) if c_to_p < 1 else 0.0
 
-    subreddits = [p["subreddit"] for p in posts] + [c["subreddit"] for c in comments]
-    subreddit_count = len(set(subreddits))
-    subreddit_diversity_score = 1 - min(subreddit_count / 10, 1.0)
-
-    times = sorted([x["created_utc"] for x in posts + comments])
     activity_spike_score = 0.0
     if len(times) > 5:
+        times.sort()
         deltas = np.diff(times)
-        mean_gap = np.mean(deltas)
+        mean_gap = deltas.mean()
         if mean_gap > 0:
-            if np.any((deltas[:-1] > mean_gap * 5) & (deltas[1:] < mean_gap / 5)):
-                activity_spike_score = 1.0
+            # Long gap immediately followed by a burst
+            for i in range(len(deltas) - 1):
+                if deltas[i] > mean_gap * 5 and deltas[i + 1] < mean_gap / 5:
+                    activity_spike_score = 1.0
+                    break
 
-    total_posts = len(posts) + len(comments)
-    total_karma = user_data["link_karma"] + user_data["comment_karma"]
+    total_posts = num_posts + num_comments
     post_to_karma_ratio = total_posts / (total_karma + 1e-6)
     post_to_karma_score = min(post_to_karma_ratio * 10, 1.0)
 
+    posts_per_day = total_posts / max(age_days, 1.0)
+    posts_per_day_score = min(posts_per_day / 20, 1.0)
+
+    avg_karma_per_post = total_karma / max(total_posts, 1)
+
+    return (age_score, comment_to_post_score, activity_spike_score,
+            post_to_karma_score, posts_per_day_score, avg_karma_per_post)
+
+
+@dataclass(slots=True)
+class Features:
+    """Per-user features read by the scoring, red-flag and report stages."""
+    age_score: float
+    age_days: float
+    comment_to_post_score: float
+    subreddit_diversity_score: float
+    subreddit_count: int
+    activity_spike_score: float
+    post_to_karma_score: float
+    duplicate_content_score: float
+    posts_per_day_score: float
+    username_suspicious_score: float
+    low_karma_score: float
+    verification_penalty: float
+    total_posts: int
+    total_comments: int
+    total_karma: int
+    avg_karma_per_post: float
+
+
+def compute_features(user_data):
+    """Compute comprehensive features for bot detection."""
+    now = time.time()
+    age_days = (now - user_data["created_utc"]) / (60 * 60 * 24)
+    posts = user_data["posts"]
+    comments = user_data["comments"]
+
+    # One pass over posts and comments collects both timestamps and subreddits
+    times = np.empty(len(posts) + len(comments), dtype=np.float64)
+    subreddits = set()
+    for i, item in enumerate(itertools.chain(posts, comments)):
+        times[i] = item["created_utc"]
+        subreddits.add(item["subreddit"])
+
+    total_karma = user_data["link_karma"] + user_data["comment_karma"]
+    (age_score, comment_to_post_score, activity_spike_score,
+     post_to_karma_score, posts_per_day_score, avg_karma_per_post) = (
+        float(v) for v in _numeric_features(
+            times, len(posts), len(comments), float(total_karma), age_days
+        )
+    )
+
+    subreddit_count = len(subreddits)
+    subreddit_diversity_score = 1 - min(subreddit_count / 10, 1.0)
+
     comment_dupe_ratio = get_duplicate_content_ratio(comments, "body")
     post_dupe_ratio = get_duplicate_content_ratio(posts, "title")
     duplicate_content_score = max(comment_dupe_ratio, post_dupe_ratio)
 
-    posts_per_day = total_posts / max(age_days, 1)
-    posts_per_day_score = min(posts_per_day / 20, 1.0)
-
     username = user_data["username"]
     username_suspicious = 0.0
     
-    if re.match(r'^\w+_\w+\d{4}$', username):
-        username_suspicious = 0.5
-    elif re.match(r'^[a-z]{8,}\d{4,}$', username.lower()):
-        username_suspicious = 0.7
+    match = _GENERATED_USERNAME_RE.fullmatch(username)
+    if match:
+        username_suspicious = _GENERATED_USERNAME_SCORES[match.lastgroup]
     elif len(username) > 20 or (len(username) < 4 and not username.isalpha()):
         username_suspicious = 0.3
 
-    avg_karma_per_post = total_karma / max(total_posts, 1)
     low_karma_score = 1.0 if avg_karma_per_post < 2 else 0.0
 
     verification_penalty = 0.0 if user_data.get("is_verified", False) else 0.2
 
-    return {
-        "age_score": age_score,
-        "age_days": age_days,
-        "comment_to_post_score": comment_to_post_score,
-        "subreddit_diversity_score": subreddit_diversity_score,
-        "subreddit_count": subreddit_count,
-        "activity_spike_score": activity_spike_score,
-        "post_to_karma_score": post_to_karma_score,
-        "duplicate_content_score": duplicate_content_score,
-        "posts_per_day_score": posts_per_day_score,
-        "username_suspicious_score": username_suspicious,
-        "low_karma_score": low_karma_score,
-        "verification_penalty": verification_penalty,
-        "total_posts": len(posts),
-        "total_comments": len(comments),
-        "total_karma": total_karma,
-        "avg_karma_per_post": avg_karma_per_post
-    }
+    return Features(
+        age_score=age_score,
+        age_days=age_days,
+        comment_to_post_score=comment_to_post_score,
+        subreddit_diversity_score=subreddit_diversity_score,
+        subreddit_count=subreddit_count,
+        activity_spike_score=activity_spike_score,
+        post_to_karma_score=post_to_karma_score,
+        duplicate_content_score=duplicate_content_score,
+        posts_per_day_score=posts_per_day_score,
+        username_suspicious_score=username_suspicious,
+        low_karma_score=low_karma_score,
+        verification_penalty=verification_penalty,
+        total_posts=len(posts),
+        total_comments=len(comments),
+        total_karma=total_karma,
+        avg_karma_per_post=avg_karma_per_post
+    )
 
 
 def compute_bot_score_100_enhanced(features):
@@ -179,83 +442,87 @@ def compute_bot_score_100_enhanced(features):
     total_score = 0.0
     breakdown = {}
     
-    age_penalty = 20 * min(1.0, math.exp(-features["age_days"] / 90))
+    age_penalty = 20 * min(1.0, math.exp(-features.age_days / 90))
     total_score += age_penalty
     breakdown["account_age_penalty"] = round(age_penalty, 2)
     
     activity_score = 0.0
     
-    if features["activity_spike_score"] > 0:
+    if features.activity_spike_score > 0:
         activity_score += 10
     
-    if features["posts_per_day_score"] > 0.5:
-        activity_score += 10 * features["posts_per_day_score"]
+    if features.posts_per_day_score > 0.5:
+        activity_score += 10 * features.posts_per_day_score
     
-    activity_score += 5 * features["username_suspicious_score"]
+    activity_score += 5 * features.username_suspicious_score
     
     total_score += min(activity_score, 20)
     breakdown["activity_pattern_penalty"] = round(min(activity_score, 20), 2)
     
     content_score = 0.0
     
-    content_score += 15 * features["duplicate_content_score"]
-    content_score += 5 * features["low_karma_score"]
+    content_score += 15 * features.duplicate_content_score
+    content_score += 5 * features.low_karma_score
     
     total_score += min(content_score, 20)
     breakdown["content_quality_penalty"] = round(min(content_score, 20), 2)
     
-    engagement_score = 20 * min(features["post_to_karma_score"] * 2, 1.0)
+    engagement_score = 20 * min(features.post_to_karma_score * 2, 1.0)
     total_score += engagement_score
     breakdown["engagement_penalty"] = round(engagement_score, 2)
     
     diversity_score = 0.0
     
-    diversity_score += 15 * features["subreddit_diversity_score"]
-    diversity_score += 5 * features["comment_to_post_score"]
+    diversity_score += 15 * features.subreddit_diversity_score
+    diversity_score += 5 * features.comment_to_post_score
     
     total_score += min(diversity_score, 20)
     breakdown["diversity_penalty"] = round(min(diversity_score, 20), 2)
     
-    total_score += features["verification_penalty"] * 5
-    breakdown["verification_penalty"] = round(features["verification_penalty"] * 5, 2)
+    total_score += features.verification_penalty * 5
+    breakdown["verification_penalty"] = round(features.verification_penalty * 5, 2)
     
     return round(min(total_score, 100), 2), breakdown
 
 
+# Classification buckets, shared by every call; callers only read them.
+# A score lands in the first bucket whose upper bound it is below.
+_CLASSIFICATION_BOUNDS = [30, 50, 70]
+_CLASSIFICATIONS = [
+    {
+        "classification": "Likely Human",
+        "confidence": "High",
+        "color": "green",
+        "description": "Normal user behavior patterns detected",
+        "risk_level": "Low"
+    },
+    {
+        "classification": "Possibly Suspicious",
+        "confidence": "Medium",
+        "color": "yellow",
+        "description": "Some bot-like characteristics detected",
+        "risk_level": "Medium"
+    },
+    {
+        "classification": "Likely Bot",
+        "confidence": "Medium-High",
+        "color": "orange",
+        "description": "Multiple bot indicators present",
+        "risk_level": "High"
+    },
+    {
+        "classification": "Almost Certainly Bot",
+        "confidence": "Very High",
+        "color": "red",
+        "description": "Strong bot behavior patterns detected",
+        "risk_level": "Critical"
+    },
+]
+
+
 def classify_bot_likelihood(bot_score_100):
-    """Classify users based on bot score (0-100)"""
-    if bot_score_100 < 30:
-        return {
-            "classification": "Likely Human",
-            "confidence": "High",
-            "color": "green",
-            "description": "Normal user behavior patterns detected",
-            "risk_level": "Low"
-        }
-    elif bot_score_100 < 50:
-        return {
-            "classification": "Possibly Suspicious",
-            "confidence": "Medium",
-            "color": "yellow",
-            "description": "Some bot-like characteristics detected",
-            "risk_level": "Medium"
-        }
-    elif bot_score_100 < 70:
-        return {
-            "classification": "Likely Bot",
-            "confidence": "Medium-High",
-            "color": "orange",
-            "description": "Multiple bot indicators present",
-            "risk_level": "High"
-        }
-    else:
-        return {
-            "classification": "Almost Certainly Bot",
-            "confidence": "Very High",
-            "color": "red",
-            "description": "Strong bot behavior patterns detected",
-            "risk_level": "Critical"
-        }
+    """Classify users based on bot score (0-100). The returned dict is shared; copy before mutating."""
+    return _CLASSIFICATIONS[bisect.bisect_right(_CLASSIFICATION_BOUNDS, bot_score_100)]
 
 
 def analyze_user_comprehensive(username):
@@ -279,13 +546,13 @@ def analyze_user_comprehensive(username):
             "description": classification["description"],
             "breakdown": breakdown,
             "account_info": {
-                "account_age_days": round(features["age_days"], 1),
-                "total_posts": features["total_posts"],
-                "total_comments": features["total_comments"],
-                "total_karma": features["total_karma"],
-                "subreddit_count": features["subreddit_count"],
-                "avg_karma_per_post": round(features["avg_karma_per_post"], 2),
-                "posts_per_day": round(features["total_posts"] / max(features["age_days"], 1), 2)
+                "account_age_days": round(features.age_days, 1),
+                "total_posts": features.total_posts,
+                "total_comments": features.total_comments,
+                "total_karma": features.total_karma,
+                "subreddit_count": features.subreddit_count,
+                "avg_karma_per_post": round(features.avg_karma_per_post, 2),
+                "posts_per_day": round(features.total_posts / max(features.age_days, 1), 2)
             },
             "red_flags": generate_red_flags(features, bot_score_100),
             "recommendations": generate_recommendations(bot_score_100, features)
@@ -303,30 +570,41 @@ def analyze_user_comprehensive(username):
         }
 
 
+def analyze_users_concurrently(usernames, max_workers=MAX_WORKERS):
+    """Run analyze_user_comprehensive over usernames on a thread pool.
+
+    Yields (username, result) pairs in completion order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(analyze_user_comprehensive, u): u for u in usernames}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
 def generate_red_flags(features, bot_score):
     """Generate list of detected red flags."""
     red_flags = []
     
-    if features["age_days"] < 90:
-        red_flags.append(f"Very new account ({round(features['age_days'], 1)} days old)")
+    if features.age_days < 90:
+        red_flags.append(f"Very new account ({round(features.age_days, 1)} days old)")
     
-    if features["subreddit_count"] < 3:
-        red_flags.append(f"Limited subreddit activity (only {features['subreddit_count']} subreddit(s))")
+    if features.subreddit_count < 3:
+        red_flags.append(f"Limited subreddit activity (only {features.subreddit_count} subreddit(s))")
     
-    if features["activity_spike_score"] > 0:
+    if features.activity_spike_score > 0:
         red_flags.append("Unusual activity spikes detected")
     
-    if features["duplicate_content_score"] > 0.3:
-        red_flags.append(f"High duplicate content ({round(features['duplicate_content_score'] * 100, 1)}% similarity)")
+    if features.duplicate_content_score > 0.3:
+        red_flags.append(f"High duplicate content ({round(features.duplicate_content_score * 100, 1)}% similarity)")
     
-    if features["posts_per_day_score"] > 0.7:
-        posts_per_day = features["total_posts"] / max(features["age_days"], 1)
+    if features.posts_per_day_score > 0.7:
+        posts_per_day = features.total_posts / max(features.age_days, 1)
         red_flags.append(f"Extremely high posting frequency ({round(posts_per_day, 1)} posts/day)")
     
-    if features["avg_karma_per_post"] < 2:
-        red_flags.append(f"Very low engagement (avg {round(features['avg_karma_per_post'], 2)} karma per post)")
+    if features.avg_karma_per_post < 2:
+        red_flags.append(f"Very low engagement (avg {round(features.avg_karma_per_post, 2)} karma per post)")
     
-    if features["username_suspicious_score"] > 0.5:
+    if features.username_suspicious_score > 0.5:
         red_flags.append("Username follows auto-generated pattern")
     
     if not red_flags:
@@ -347,23 +625,52 @@ def generate_recommendations(bot_score, features):
         return "Very high probability of bot activity. Immediate action recommended: ban or severe restrictions."
 
 
+def score_statistics(valid_scores):
+    """Average/median/range and per-classification counts for a non-empty list of scores."""
+    # One pass; each score's bucket index matches classify_bot_likelihood
+    counts = [0] * len(_CLASSIFICATIONS)
+    for score in valid_scores:
+        counts[bisect.bisect_right(_CLASSIFICATION_BOUNDS, score)] += 1
+    return {
+        "average_bot_score": round(sum(valid_scores) / len(valid_scores), 2),
+        "median_bot_score": round(median(valid_scores), 2),
+        "min_bot_score": round(min(valid_scores), 2),
+        "max_bot_score": round(max(valid_scores), 2),
+        "likely_humans": counts[0],
+        "suspicious": counts[1],
+        "likely_bots": counts[2],
+        "almost_certain_bots": counts[3]
+    }
+
+
 def analyze_multiple_users(usernames, save_to_file=True):
-    """Analyze multiple users and optionally save results to JSON."""
+    """Analyze multiple users and optionally save results.
+
+    Results are streamed to <name>.ndjson (one user per line) as they finish;
+    summary statistics go to <name>.stats.json.
+    """
     results = []
+    basename = f"bot_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
     print(f"\n{'='*60}")
     print(f"Analyzing {len(usernames)} users...")
     print(f"{'='*60}\n")
     
-    for i, username in enumerate(usernames, 1):
-        print(f"[{i}/{len(usernames)}] Analyzing u/{username}...", end=" ")
-        result = analyze_user_comprehensive(username)
-        results.append(result)
-        
-        if result.get("bot_score") is not None:
-            print(f"Score: {result['bot_score']}/100")
-        else:
-            print(f"Error: {result.get('error', 'Unknown')}")
+    ndjson = open(f"{basename}.ndjson", "wb") if save_to_file else None
+    try:
+        for i, (username, result) in enumerate(analyze_users_concurrently(usernames), 1):
+            print(f"[{i}/{len(usernames)}] u/{username}:", end=" ")
+            results.append(result)
+            if ndjson is not None:
+                ndjson.write(orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n")
+            
+            if result.get("bot_score") is not None:
+                print(f"Score: {result['bot_score']}/100")
+            else:
+                print(f"Error: {result.get('error', 'Unknown')}")
+    finally:
+        if ndjson is not None:
+            ndjson.close()
     
     valid_scores = [r["bot_score"] for r in results if r.get("bot_score") is not None]
     
@@ -372,14 +679,7 @@ def analyze_multiple_users(usernames, save_to_file=True):
             "total_analyzed": len(usernames),
             "successful_analyses": len(valid_scores),
             "failed_analyses": len(usernames) - len(valid_scores),
-            "average_bot_score": round(np.mean(valid_scores), 2),
-            "median_bot_score": round(np.median(valid_scores), 2),
-            "min_bot_score": round(min(valid_scores), 2),
-            "max_bot_score": round(max(valid_scores), 2),
-            "likely_humans": sum(1 for s in valid_scores if s < 30),
-            "suspicious": sum(1 for s in valid_scores if 30 <= s < 50),
-            "likely_bots": sum(1 for s in valid_scores if 50 <= s < 70),
-            "almost_certain_bots": sum(1 for s in valid_scores if s >= 70)
+            **score_statistics(valid_scores)
         }
         
         print(f"\n{'='*60}")
@@ -406,10 +706,12 @@ def analyze_multiple_users(usernames, save_to_file=True):
         }
         
         if save_to_file:
-            filename = f"bot_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            with open(filename, 'w') as f:
-                json.dump(output, f, indent=2)
-            print(f"Results saved to: {filename}\n")
+            with open(f"{basename}.stats.json", "wb") as f:
+                f.write(orjson.dumps(
+                    {"analysis_date": output["analysis_date"], "statistics": stats},
+                    option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY,
+                ))
+            print(f"Results saved to: {basename}.ndjson (statistics in {basename}.stats.json)\n")
         
         return output
     
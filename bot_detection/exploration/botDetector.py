@@ -3,8 +3,6 @@ from dotenv import load_dotenv
 import os
 import numpy as np
 import time
-from datetime import datetime
-from collections import Counter
 import math
 import re
 from difflib import SequenceMatcher
@@ -38,7 +36,7 @@ def fetch_user_data_safe(username, limit=50):
         for post in user.submissions.new(limit=limit):
             user_data["posts"].append({
                 "created_utc": post.created_utc,
-                "subreddit": str(post.subreddit),
+                "subreddit": post.subreddit.display_name,
                 "score": post.score,
                 "title": post.title,
                 "selftext": post.selftext
@@ -46,7 +44,7 @@ def fetch_user_data_safe(username, limit=50):
         for com in user.comments.new(limit=limit):
             user_data["comments"].append({
                 "created_utc": com.created_utc,
-                "subreddit": str(com.subreddit),
+                "subreddit": com.subreddit.display_name,
                 "score": com.score,
                 "body": com.body
             })
@@ -111,17 +109,25 @@ def compute_features(user_data):
     comment_to_post_score = 1 - min(1.0, c_to_p) if c_to_p < 1 else 0.0
 
     # --- 3. Subreddit diversity ---
-    subreddits = [p["subreddit"] for p in posts] + [c["subreddit"] for c in comments]
-    subreddit_count = len(set(subreddits))
+    subreddit_count = len({p["subreddit"] for p in posts} | {c["subreddit"] for c in comments})
     # Fewer subreddits = more bot-like
     subreddit_diversity_score = 1 - min(subreddit_count / 10, 1.0)  # 1 subreddit → 0.9, 10+ → 0.0
 
     # --- 4. Activity spikes ---
-    times = sorted([x["created_utc"] for x in posts + comments])
+    # Sort raw float64 memory instead of a list of boxed Python floats
+    times = np.empty(len(posts) + len(comments), dtype=np.float64)
+    idx = 0
+    for p in posts:
+        times[idx] = p["created_utc"]
+        idx += 1
+    for c in comments:
+        times[idx] = c["created_utc"]
+        idx += 1
+    times.sort()
     activity_spike_score = 0.0
     if len(times) > 5:
         deltas = np.diff(times)
-        mean_gap = np.mean(deltas)
+        mean_gap = deltas.mean()
         if np.any((deltas[:-1] > mean_gap * 5) & (deltas[1:] < mean_gap / 5)):
             activity_spike_score = 1.0
 
@@ -207,6 +213,8 @@ def compute_bot_score(features):
 
 def analyze_user(username):
     data = fetch_user_data_safe(username)
+    if data is None:
+        return {"username": username, "bot_score": None, "features": None}
     features = compute_features(data)
     bot_score = compute_bot_score(features)
     return {
@@ -225,6 +233,9 @@ def generate_bot_score(username):
 if __name__ == "__main__":
     test_user = input("Enter Reddit username to analyze: ")
     result = analyze_user(test_user)
+    if result["bot_score"] is None:
+        print(f"Could not analyze {test_user}: user not found, suspended, or private.")
+        raise SystemExit(1)
     print("\n--- Bot Score Report ---")
     print(f"Username: {result['username']}")
     print(f"Bot Score: {result['bot_score']:.2f}")
@@ -4,21 +4,27 @@ Subreddit Bot Scanner
 Collects users from specific subreddits and analyzes them for bot behavior
 """
 
-import praw
-from dotenv import load_dotenv
-import os
-import json
+import orjson
 from datetime import datetime
-from enhanced_bot_detector import analyze_user_comprehensive, classify_bot_likelihood
-import numpy as np
+from enhanced_bot_detector import analyze_users_concurrently, classify_bot_likelihood, get_reddit, score_statistics
+from concurrent.futures import ThreadPoolExecutor
 
-load_dotenv()
 
-reddit = praw.Reddit(
-    client_id=os.getenv("CLIENT_ID"),
-    client_secret=os.getenv("CLIENT_SECRET"),
-    user_agent="bot detection unwrapathon"
-)
+COMMENT_FETCH_WORKERS = 8
+
+
+def _fetch_post_authors(post_id, comment_limit):
+    """Comment authors of one post, fetched with this thread's PRAW client."""
+    try:
+        submission = get_reddit().submission(id=post_id)
+        submission.comments.replace_more(limit=0)
+        return [
+            comment.author.name
+            for comment in submission.comments.list()[:comment_limit]
+            if getattr(comment, 'author', None) and comment.author.name != "AutoModerator"
+        ]
+    except Exception:
+        return []
 
 
 def collect_users_from_subreddit(subreddit_name, post_limit=50, comment_limit=100):
@@ -34,21 +40,22 @@ def collect_users_from_subreddit(subreddit_name, post_limit=50, comment_limit=10
         set: Unique usernames found in the subreddit
     """
     print(f"\nCollecting users from r/{subreddit_name}...")
-    subreddit = reddit.subreddit(subreddit_name)
+    subreddit = get_reddit().subreddit(subreddit_name)
     usernames = set()
     
     try:
-        for post in subreddit.hot(limit=post_limit):
+        posts = list(subreddit.hot(limit=post_limit))
+        for post in posts:
             if post.author and post.author.name != "AutoModerator":
                 usernames.add(post.author.name)
-            
-            try:
-                post.comments.replace_more(limit=0)
-                for comment in post.comments.list()[:comment_limit]:
-                    if hasattr(comment, 'author') and comment.author and comment.author.name != "AutoModerator":
-                        usernames.add(comment.author.name)
-            except Exception as e:
-                continue
+        
+        # Each post's comment tree is a separate blocking request, so fetch
+        # them on a thread pool
+        with ThreadPoolExecutor(max_workers=COMMENT_FETCH_WORKERS) as executor:
+            for authors in executor.map(
+                _fetch_post_authors, [post.id for post in posts], [comment_limit] * len(posts)
+            ):
+                usernames.update(authors)
         
         print(f"Found {len(usernames)} unique users")
         return usernames
@@ -107,27 +114,22 @@ def analyze_subreddit_users(subreddit_name, user_limit=20, post_limit=50):
     print(f"\nAnalyzing {len(usernames_list)} users...")
     
     results = []
+    basename = f"subreddit_analysis_{subreddit_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    for i, username in enumerate(usernames_list, 1):
-        print(f"[{i}/{len(usernames_list)}] Analyzing u/{username}...", end=" ")
-        
-        try:
-            result = analyze_user_comprehensive(username)
+    # analyze_user_comprehensive catches its own errors, so every future
+    # resolves to a result dict. Each one is appended to the NDJSON file as
+    # soon as it arrives.
+    with open(f"{basename}.ndjson", "wb") as ndjson:
+        for i, (username, result) in enumerate(analyze_users_concurrently(usernames_list), 1):
+            print(f"[{i}/{len(usernames_list)}] u/{username}:", end=" ")
             results.append(result)
+            ndjson.write(orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n")
             
             if result.get("bot_score") is not None:
                 classification = classify_bot_likelihood(result["bot_score"])
                 print(f"Score: {result['bot_score']}/100 ({classification['classification']})")
             else:
                 print(f"Error: {result.get('error', 'Unknown')}")
-        
-        except Exception as e:
-            print(f"Error: {str(e)}")
-            results.append({
-                "username": username,
-                "error": str(e),
-                "bot_score": None
-            })
     
     valid_scores = [r["bot_score"] for r in results if r.get("bot_score") is not None]
     
@@ -138,14 +140,7 @@ def analyze_subreddit_users(subreddit_name, user_limit=20, post_limit=50):
             "users_analyzed": len(usernames_list),
             "successful_analyses": len(valid_scores),
             "failed_analyses": len(usernames_list) - len(valid_scores),
-            "average_bot_score": round(np.mean(valid_scores), 2),
-            "median_bot_score": round(np.median(valid_scores), 2),
-            "min_bot_score": round(min(valid_scores), 2),
-            "max_bot_score": round(max(valid_scores), 2),
-            "likely_humans": sum(1 for s in valid_scores if s < 30),
-            "suspicious": sum(1 for s in valid_scores if 30 <= s < 50),
-            "likely_bots": sum(1 for s in valid_scores if 50 <= s < 70),
-            "almost_certain_bots": sum(1 for s in valid_scores if s >= 70)
+            **score_statistics(valid_scores)
         }
         
         print(f"\n{'='*60}")
@@ -172,10 +167,12 @@ def analyze_subreddit_users(subreddit_name, user_limit=20, post_limit=50):
             "results": results
         }
         
-        filename = f"subreddit_analysis_{subreddit_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(filename, 'w') as f:
-            json.dump(output, f, indent=2)
-        print(f"Results saved to: {filename}\n")
+        with open(f"{basename}.stats.json", "wb") as f:
+            f.write(orjson.dumps(
+                {"analysis_date": output["analysis_date"], "statistics": stats},
+                option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY,
+            ))
+        print(f"Results saved to: {basename}.ndjson (statistics in {basename}.stats.json)\n")
         
         return output
     
@@ -218,8 +215,8 @@ def analyze_multiple_subreddits(subreddit_names, users_per_subreddit=20, posts_p
             print()
     
     filename = f"multi_subreddit_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    with open(filename, 'w') as f:
-        json.dump(all_results, f, indent=2)
+    with open(filename, 'wb') as f:
+        f.write(orjson.dumps(all_results, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     print(f"Combined results saved to: {filename}\n")
     
     return all_results
@@ -10,11 +10,24 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from database import RedditDataManager
+from database import RedditDataManager, embedding_from_bson
 import numpy as np
 import re
-from collections import Counter
-from sklearn.cluster import KMeans
+from sklearn.feature_extraction.text import CountVectorizer
+from cluster_utils import cached_knn, choose_k, l2_normalize, plot_clusters, quiet_missing_knn_index, top_terms
+
+# Common stop words, left out of cluster keywords
+_STOP_WORDS = frozenset({
+    'the', 'and', 'for', 'are', 'but', 'not', 'you', 'all', 'can', 'had', 'her', 'was', 'one', 'our', 'out', 'day', 'get', 'has', 'him', 'his', 'how', 'its', 'may', 'new', 'now', 'old', 'see', 'two', 'who', 'boy', 'did', 'man', 'men', 'put', 'say', 'she', 'too', 'use', 'this', 'that', 'with', 'have', 'will', 'your', 'from', 'they', 'know', 'want', 'been', 'good', 'much', 'some', 'time', 'very', 'when', 'come', 'here', 'just', 'like', 'long', 'make', 'many', 'over', 'such', 'take', 'than', 'them', 'well', 'were'
+})
+
+# Words of 3+ letters that aren't stop words: the negative lookahead drops stop
+# words inside the regex scan, so tokens never need filtering in Python
+_WORD_RE = re.compile(
+    r'\b(?!(?:'
+    + '|'.join(map(re.escape, sorted(_STOP_WORDS, key=len, reverse=True)))
+    + r')\b)[a-zA-Z]{3,}\b'
+)
 
 def analyze_clusters():
     """Analyze what topics are in your UMAP clusters."""
@@ -30,114 +43,105 @@ def analyze_clusters():
     
     try:
         # Get posts
-        posts = list(db.mongo.posts_collection.find().limit(100))
-        
-        if len(posts) < 10:
-            print("Not enough posts for analysis")
-            return
+        # Only fetch posts that have an embedding, and only the fields used here;
+        # the cursor is streamed in batches straight into the arrays below
+        limit = 100
+        cursor = db.mongo.posts_collection.find(
+            {"embedding": {"$exists": True, "$ne": []}},
+            {"embedding": 1, "title": 1, "selftext": 1, "score": 1, "_id": 0}
+        ).batch_size(50).limit(limit)
         
         # Extract embeddings and text
-        embeddings = []
+        # Embeddings go straight into a float32 matrix and are unit-normalized
+        # once, so UMAP can use euclidean distance (same neighbours as cosine)
+        embeddings_array = None
         titles = []
         selftexts = []
         scores = []
         
-        for post in posts:
-            if "embedding" in post and post["embedding"]:
-                embeddings.append(post["embedding"])
-                titles.append(post.get("title", ""))
-                selftexts.append(post.get("selftext", ""))
-                scores.append(post.get("score", 0))
+        for i, post in enumerate(cursor):
+            embedding = embedding_from_bson(post["embedding"])
+            if embeddings_array is None:
+                embeddings_array = np.empty((limit, len(embedding)), dtype=np.float32)
+            embeddings_array[i] = embedding
+            titles.append(post.get("title", ""))
+            selftexts.append(post.get("selftext", ""))
+            scores.append(post.get("score", 0))
         
-        embeddings_array = np.array(embeddings)
+        if len(scores) < 10:
+            print("Not enough posts for analysis")
+            return
+        
+        embeddings_array = l2_normalize(embeddings_array[:len(scores)])
+        
+        # Reuse a cached KNN graph when these embeddings have been seen before
+        precomputed_knn = cached_knn(embeddings_array)
         
         # Use optimized UMAP parameters
         reducer = umap.UMAP(
             n_components=2,
             n_neighbors=5,  # Tight clusters
             min_dist=0.05,  # Very tight
-            metric='cosine',
+            metric='euclidean',
+            precomputed_knn=precomputed_knn,
+            init='random',  # Skip the spectral eigensolve; fine at this size
+            low_memory=False,
             random_state=42
         )
         
-        umap_embedding = reducer.fit_transform(embeddings_array)
-        
-        # Find optimal number of clusters
-        from sklearn.metrics import silhouette_score
-        
-        silhouette_scores = {}
+        # transform() isn't used, so a cached graph without its index is fine
+        with quiet_missing_knn_index():
+            umap_embedding = reducer.fit_transform(embeddings_array)
         
-        for k in [2, 3, 4, 5, 6, 7, 8, 10]:
-            kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-            cluster_labels = kmeans.fit_predict(umap_embedding)
-            silhouette_avg = silhouette_score(umap_embedding, cluster_labels)
-            silhouette_scores[k] = silhouette_avg
-        
-        # Find best K
-        best_k = max(silhouette_scores.items(), key=lambda x: x[1])[0]
-        best_silhouette = silhouette_scores[best_k]
+        # Find optimal number of clusters (inertia knee, silhouette tie-break)
+        # and keep the chosen model's labels rather than refitting
+        best_k, cluster_labels, best_silhouette = choose_k(umap_embedding)
         
         print(f"Best clustering: K={best_k} (silhouette={best_silhouette:.4f})")
         
         chosen_k = best_k
         
-        # Get final cluster labels
-        kmeans = KMeans(n_clusters=chosen_k, random_state=42, n_init=10)
-        cluster_labels = kmeans.fit_predict(umap_embedding)
-        
         # Create UMAP visualization
-        import matplotlib.pyplot as plt
-        
-        plt.figure(figsize=(10, 8))
-        
-        scatter = plt.scatter(
-            umap_embedding[:, 0], umap_embedding[:, 1],
-            c=cluster_labels, cmap='tab10', alpha=0.7, s=50
+        plot_clusters(
+            umap_embedding, cluster_labels,
+            f'UMAP Clustering for Posts - {chosen_k} Clusters',
+            'post_clusters.png'
         )
         
-        plt.title(f'UMAP Clustering for Posts - {chosen_k} Clusters')
-        plt.xlabel('UMAP 1')
-        plt.ylabel('UMAP 2')
-        plt.colorbar(scatter, label='Cluster')
+        # Analyze each cluster
         
-        plt.tight_layout()
-        plt.show()
+        # Tokenize every post once; each cluster's keyword counts are then a
+        # sparse row sum over its posts
+        vectorizer = CountVectorizer(
+            tokenizer=_WORD_RE.findall,
+            token_pattern=None,
+            lowercase=True
+        )
+        term_counts = vectorizer.fit_transform([t + " " + s for t, s in zip(titles, selftexts)])
+        terms = vectorizer.get_feature_names_out()
         
-        # Analyze each cluster
+        scores = np.asarray(scores)
         
         for cluster_id in range(chosen_k):
-            cluster_indices = [i for i, label in enumerate(cluster_labels) if label == cluster_id]
-            cluster_posts = [posts[i] for i in cluster_indices]
+            cluster_indices = np.flatnonzero(cluster_labels == cluster_id)
             
-            print(f"\nCluster {cluster_id} ({len(cluster_posts)} posts):")
+            print(f"\nCluster {cluster_id} ({len(cluster_indices)} posts):")
             
             # Extract keywords from this cluster
-            all_text = " ".join([titles[i] + " " + selftexts[i] for i in cluster_indices])
-            
-            # Simple keyword extraction
-            words = re.findall(r'\b[a-zA-Z]{3,}\b', all_text.lower())
-            
-            # Remove common stop words
-            stop_words = {
-                'the', 'and', 'for', 'are', 'but', 'not', 'you', 'all', 'can', 'had', 'her', 'was', 'one', 'our', 'out', 'day', 'get', 'has', 'him', 'his', 'how', 'its', 'may', 'new', 'now', 'old', 'see', 'two', 'who', 'boy', 'did', 'man', 'men', 'put', 'say', 'she', 'too', 'use', 'this', 'that', 'with', 'have', 'will', 'your', 'from', 'they', 'know', 'want', 'been', 'good', 'much', 'some', 'time', 'very', 'when', 'come', 'here', 'just', 'like', 'long', 'make', 'many', 'over', 'such', 'take', 'than', 'them', 'well', 'were'
-            }
-            
-            filtered_words = [w for w in words if w not in stop_words]
-            word_counts = Counter(filtered_words)
+            word_counts = np.asarray(term_counts[cluster_indices].sum(axis=0)).ravel()
             
             # Calculate average score for this cluster
-            cluster_scores = [scores[i] for i in cluster_indices]
-            avg_score = np.mean(cluster_scores)
+            avg_score = scores[cluster_indices].mean()
             
             # Try to identify the topic
-            top_words = [word for word, count in word_counts.most_common(5)]
-            print(f"  Topic: {' '.join(top_words[:3])} | Score: {avg_score:.1f} | Keywords: {[word for word, count in word_counts.most_common(5)]}")
+            top_words = top_terms(word_counts, terms, 5)
+            print(f"  Topic: {' '.join(top_words[:3])} | Score: {avg_score:.1f} | Keywords: {top_words}")
         
         # Show cluster distribution
-        cluster_counts = Counter(cluster_labels)
+        cluster_ids, cluster_counts = np.unique(cluster_labels, return_counts=True)
+        percentages = cluster_counts * (100.0 / len(cluster_labels))
         print(f"\nCluster Distribution:")
-        for cluster_id, count in sorted(cluster_counts.items()):
-            percentage = (count / len(cluster_labels)) * 100
+        for cluster_id, count, percentage in zip(cluster_ids, cluster_counts, percentages):
             print(f"  Cluster {cluster_id}: {count} posts ({percentage:.1f}%)")
         
     except Exception as e:
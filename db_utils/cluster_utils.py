@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Cluster Selection Helpers
+=========================
+
+Shared by the UMAP cluster analysis scripts for posts and comments.
+"""
+
+import hashlib
+import os
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import pairwise_distances_chunked
+
+CANDIDATE_KS = (2, 3, 4, 5, 6, 7, 8, 10)
+SILHOUETTE_PIVOTS = 500
+KNN_CACHE_DIR = ".knn_cache"
+HEXBIN_MIN_POINTS = 5000
+# A knee must dip at least this far below the normalized chord to be trusted;
+# flatter curves have no clear elbow, so every k gets a silhouette score
+KNEE_MIN_DEPTH = 0.05
+
+
+def l2_normalize(X):
+    """Scale the rows of X to unit length in place (zero rows are left as is)."""
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    X /= norms
+    return X
+
+
+def cached_knn(X, n_neighbors=15, metric="euclidean", random_state=42):
+    """
+    Nearest-neighbour graph of X for UMAP's precomputed_knn.
+
+    The graph is built once with pynndescent and cached on disk, keyed by
+    the embedding bytes and graph parameters, so reruns over the same data
+    skip the KNN build. n_neighbors should be at least UMAP's n_neighbors.
+
+    A fresh build returns the NNDescent index along with the graph. A cache
+    hit has only the graph, so UMAP's transform() of new points is
+    unavailable on that run (fit_transform is unaffected); fit such a reducer
+    inside quiet_missing_knn_index() to skip UMAP's warning about it.
+
+    Returns:
+        tuple: (knn indices, knn distances, NNDescent index) on a build,
+            (knn indices, knn distances) on a cache hit
+    """
+    n_neighbors = min(n_neighbors, len(X) - 1)
+    key = hashlib.sha1(X.tobytes())
+    key.update(f"{X.shape}:{n_neighbors}:{metric}".encode())
+    path = os.path.join(KNN_CACHE_DIR, key.hexdigest() + ".npz")
+
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            return cached["indices"], cached["distances"]
+
+    from pynndescent import NNDescent
+    index = NNDescent(X, metric=metric, n_neighbors=n_neighbors, random_state=random_state)
+    indices, distances = index.neighbor_graph
+
+    os.makedirs(KNN_CACHE_DIR, exist_ok=True)
+    np.savez(path, indices=indices, distances=distances)
+    return indices, distances, index
+
+
+@contextmanager
+def quiet_missing_knn_index():
+    """Silence UMAP's warning for a precomputed_knn without its NNDescent index."""
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message=r"precomputed_knn\[2\]")
+        yield
+
+
+def knee_depths(ks, inertias):
+    """How far each point of the inertia curve dips below its normalized chord."""
+    ks = np.asarray(ks, dtype=np.float64)
+    inertias = np.asarray(inertias, dtype=np.float64)
+    # Normalize both axes to [0, 1]; a decreasing convex curve then runs from
+    # (0, 1) to (1, 0) and the knee sits furthest below the chord y = 1 - x.
+    # Both ends lie on the chord (depth 0), so this never picks an endpoint
+    x = (ks - ks[0]) / (ks[-1] - ks[0])
+    y = (inertias - inertias.min()) / (np.ptp(inertias) or 1.0)
+    return (1 - x) - y
+
+
+def pivot_silhouette(X, labels, n_pivots=SILHOUETTE_PIVOTS, random_state=42):
+    """
+    Silhouette score estimated against a random subset of pivot points.
+
+    Each point's mean distance to its own and to the nearest other cluster
+    is taken over the pivots only, so the cost is O(n * n_pivots) instead of
+    O(n^2), and every point still contributes. With n <= n_pivots all points
+    are pivots and the result is the exact silhouette score.
+    """
+    n = len(X)
+    _, labels = np.unique(labels, return_inverse=True)
+    rows = np.arange(n)
+
+    if n <= n_pivots:
+        pivots = rows
+    else:
+        pivots = np.sort(np.random.default_rng(random_state).choice(n, n_pivots, replace=False))
+    membership = np.zeros((len(pivots), labels.max() + 1))
+    membership[np.arange(len(pivots)), labels[pivots]] = 1
+
+    # Per-cluster sums of distances to the pivots, built chunk by chunk
+    sums = np.vstack(list(pairwise_distances_chunked(
+        X, X[pivots], reduce_func=lambda chunk, start: chunk @ membership
+    )))
+    counts = np.tile(membership.sum(axis=0), (n, 1))
+    counts[pivots, labels[pivots]] -= 1  # a pivot's distance to itself doesn't count
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.where(counts > 0, sums / counts, np.inf)
+    a = means[rows, labels]
+    means[rows, labels] = np.inf
+    b = means.min(axis=1)
+
+    # Points alone in their cluster (among the pivots) score 0, as in sklearn
+    spread = np.maximum(a, b)
+    valid = np.isfinite(spread) & (spread > 0)
+    s = np.zeros(n)
+    s[valid] = (b[valid] - a[valid]) / spread[valid]
+    return float(s.mean())
+
+
+def choose_k(X, ks=CANDIDATE_KS, random_state=42):
+    """
+    Pick the number of clusters for X.
+
+    Fits MiniBatchKMeans for each k, takes the smallest k plus the two best
+    knee candidates on the inertia curve and keeps whichever has the highest
+    (pivot-estimated) silhouette score. Without a clear knee every k is scored.
+
+    Returns:
+        tuple: (k, cluster labels, silhouette score)
+    """
+    ks = [k for k in ks if k < len(X)]
+    models = [
+        MiniBatchKMeans(n_clusters=k, n_init=3, batch_size=256, random_state=random_state).fit(X)
+        for k in ks
+    ]
+    candidates = range(len(models))
+    if len(models) >= 3:
+        depths = knee_depths(ks, [m.inertia_ for m in models])
+        if depths.max() >= KNEE_MIN_DEPTH:
+            # The knee never lands on an endpoint, so the smallest k (often
+            # right for well-separated data) is always scored as well
+            candidates = sorted({0, *np.argsort(-depths, kind="stable")[:2].tolist()})
+
+    best = None
+    for i in candidates:
+        score = pivot_silhouette(X, models[i].labels_, random_state=random_state)
+        if best is None or score > best[2]:
+            best = (ks[i], models[i].labels_, score)
+    return best
+
+
+def top_terms(counts, terms, n=5):
+    """The n most frequent terms (highest count first), skipping unused ones."""
+    n = min(n, len(counts))
+    if n == 0:
+        return []
+    top = np.argpartition(-counts, n - 1)[:n]
+    top = top[np.argsort(-counts[top], kind="stable")]
+    return [str(terms[i]) for i in top if counts[i] > 0]
+
+
+def plot_clusters(points, labels, title, path):
+    """
+    Plot 2-D points coloured by cluster and save the figure to path.
+
+    Points are drawn rasterized, and above HEXBIN_MIN_POINTS they are binned
+    with hexbin instead, so drawing cost stays flat as the data grows. The
+    window is only shown when matplotlib has an interactive backend.
+    """
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(10, 8))
+
+    if len(points) > HEXBIN_MIN_POINTS:
+        mappable = plt.hexbin(
+            points[:, 0], points[:, 1], C=labels,
+            reduce_C_function=np.median, gridsize=60, cmap='tab10'
+        )
+    else:
+        mappable = plt.scatter(
+            points[:, 0], points[:, 1],
+            c=labels, cmap='tab10', alpha=0.7, s=50, rasterized=True
+        )
+
+    plt.title(title)
+    plt.xlabel('UMAP 1')
+    plt.ylabel('UMAP 2')
+    plt.colorbar(mappable, label='Cluster')
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=120)
+    if plt.get_backend().lower() != 'agg':
+        plt.show()
+    plt.close()
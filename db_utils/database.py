@@ -1,11 +1,28 @@
+import hashlib
 import os
+import platform
+import sqlite3
 from datetime import datetime, timezone
-from typing import List, Dict, Optional
-from pymongo import MongoClient
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
+from bson.binary import Binary, BinaryVectorDtype, VECTOR_SUBTYPE
+from pymongo import ASCENDING, DESCENDING, IndexModel, MongoClient, UpdateOne
+from pymongo.operations import SearchIndexModel
 from pymongo.collection import Collection
 from pymongo.database import Database
+from pymongo.errors import BulkWriteError, OperationFailure
 from dotenv import load_dotenv
 import logging
+import numpy as np
+import threading
+
+# CPU threads for embedding inference; 4-8 intra-op threads is the sweet spot
+# for small sentence transformers. OpenMP/MKL read these before torch loads.
+EMBEDDING_THREADS = min(8, os.cpu_count() or 4)
+os.environ.setdefault("OMP_NUM_THREADS", str(EMBEDDING_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(EMBEDDING_THREADS))
+
+import torch
 from sentence_transformers import SentenceTransformer
 
 load_dotenv()
@@ -15,6 +32,153 @@ ENABLE_LOGGING = os.getenv("ENABLE_LOGGING", "false").lower() == "true"
 logging.basicConfig(level=logging.INFO if ENABLE_LOGGING else logging.CRITICAL)
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_DIMENSIONS = 384
+# Tokens the model attends to (MiniLM's default is 256). Attention cost grows
+# with the square of this, and Reddit titles and the first lines of a body
+# carry nearly all of the signal
+EMBED_MAX_TOKENS = 128
+# Cheap character pre-trim so huge selftexts aren't fully tokenized; at a few
+# characters per token this is well past EMBED_MAX_TOKENS, so the tokenizer's
+# truncation is what actually decides the cut
+MAX_EMBED_CHARS = 1000
+EMBED_BATCH_SIZE = 64
+# A GPU only saturates with larger batches; FP16 keeps 256 x 128 tokens small
+GPU_EMBED_BATCH_SIZE = 256
+
+# BSON vector header: dtype byte, then padding (always 0 for float32)
+_FLOAT32_VECTOR_HEADER = BinaryVectorDtype.FLOAT32.value + b"\x00"
+
+def embedding_to_bson(embedding) -> Binary:
+    """Pack an embedding as a BSON float32 vector (about a third of the size of an array of doubles)"""
+    # Same bytes as Binary.from_vector, but copied straight from the array
+    # instead of going through a list of 384 Python floats
+    return Binary(_FLOAT32_VECTOR_HEADER + np.asarray(embedding, dtype='<f4').tobytes(), VECTOR_SUBTYPE)
+
+def embedding_from_bson(value) -> np.ndarray:
+    """Stored embedding as a float32 array, from a BSON vector or a legacy list of floats"""
+    if isinstance(value, Binary) and value.subtype == VECTOR_SUBTYPE:
+        # Skip the two header bytes (dtype, padding) in front of the packed floats
+        return np.frombuffer(value, dtype='<f4', offset=2)
+    return np.asarray(value, dtype=np.float32)
+
+# "torch" (default) or "onnx". The ONNX backend runs the model's int8-quantized
+# export on CPU; it needs sentence-transformers>=3.2 and optimum[onnxruntime].
+# Embeddings differ slightly between backends, so use one backend per database.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+
+def _default_onnx_model_file() -> str:
+    """Pick the model's int8 export built for this CPU's instruction set"""
+    machine = platform.machine().lower()
+    if machine in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        flags = ""
+    # VNNI does the int8 dot products in one instruction; without it the
+    # AVX2 export (unsigned int8) is the faster of the two
+    if "avx512_vnni" in flags or "avx512vnni" in flags or not flags:
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+# Override to use a specific export (e.g. "onnx/model_O3.onnx")
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE") or _default_onnx_model_file()
+# Where downloaded model files live (Hugging Face's default cache if unset);
+# pointing repeated jobs at one persistent folder keeps cold starts off the network
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")
+
+# Computed embeddings persist here so re-crawled posts and comments aren't re-encoded
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", "embeddingcache.db")
+
+# MongoDB's duplicate key error code
+DUPLICATE_KEY_ERROR = 11000
+# Documents per bulk_write request when upserting posts and comments
+BULK_WRITE_CHUNK = 500
+
+# Atlas Vector Search indexes: collection -> (index name, filterable fields).
+# Scalar quantization keeps int8 vectors in the index (about 4x smaller and
+# faster to scan) while documents still store the full-precision embedding.
+VECTOR_INDEXES = {
+    "posts": ("posts_vector_idx", ["subreddit"]),
+    "comments": ("comments_vector_idx", ["subreddit", "post_id"]),
+}
+
+class EmbeddingCache:
+    """
+    Persistent text -> embedding cache keyed by content hash.
+
+    Keys are SHA-256 of a model fingerprint plus the text, so changing the
+    model (or how its output is post-processed) never returns stale vectors.
+    Vectors are stored as float32 bytes in SQLite, with the most recently
+    used ones also kept in memory.
+    """
+
+    # SQLite caps the number of bound parameters per statement
+    MAX_PARAMS = 500
+
+    def __init__(self, path: str, fingerprint: str, memory_maxsize: int = 10_000):
+        self.fingerprint = fingerprint
+        self.memory_maxsize = memory_maxsize
+        self.memory = {}
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+        )
+
+    def key(self, text: str) -> str:
+        """Cache key for one text"""
+        return hashlib.sha256(f"{self.fingerprint}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self.memory.pop(key, None)
+        if len(self.memory) >= self.memory_maxsize:
+            # dicts keep insertion order, so this drops the least recently used entry
+            self.memory.pop(next(iter(self.memory)))
+        self.memory[key] = vector
+
+    def get_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """Cached embeddings for whichever of texts have one, keyed by text"""
+        keys = {self.key(text): text for text in texts}
+        found = {}
+        with self.lock:
+            missing = []
+            for key, text in keys.items():
+                vector = self.memory.get(key)
+                if vector is None:
+                    missing.append(key)
+                else:
+                    self._remember(key, vector)
+                    found[text] = vector
+
+            for i in range(0, len(missing), self.MAX_PARAMS):
+                chunk = missing[i:i + self.MAX_PARAMS]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    self._remember(key, vector)
+                    found[keys[key]] = vector
+        return found
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        """Store one embedding per text; all-zero vectors (failed encodes) are skipped"""
+        entries = {
+            self.key(text): np.asarray(vector, dtype=np.float32)
+            for text, vector in zip(texts, vectors) if vector.any()
+        }
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                [(key, vector.tobytes()) for key, vector in entries.items()]
+            )
+            self.conn.commit()
+            for key, vector in entries.items():
+                self._remember(key, vector)
+
 class MongoDBConnection:
     def __init__(self):
         self.client: Optional[MongoClient] = None
@@ -31,7 +195,18 @@ class MongoDBConnection:
             if not connection_string:
                 raise ValueError("MONGODB_URI environment variable not set")
             
-            self.client = MongoClient(connection_string)
+            # Acknowledged but unjournaled writes and compressed wire traffic
+            # keep bulk ingestion from stalling on fsyncs and bandwidth
+            self.client = MongoClient(
+                connection_string,
+                w=1,
+                journal=False,
+                compressors="zstd,zlib",
+                maxPoolSize=50,
+                minPoolSize=5,
+                serverSelectionTimeoutMS=3000,
+                socketTimeoutMS=15000
+            )
             self.db = self.client.reddit
             self.posts_collection = self.db.posts
             self.comments_collection = self.db.comments
@@ -41,48 +216,233 @@ class MongoDBConnection:
             self.client.admin.command('ping')
             logger.info("Successfully connected to MongoDB Atlas")
             
+            self.ensure_indexes()
+            
         except Exception as e:
             logger.error(f"Failed to connect to MongoDB: {e}")
             raise
     
+    def ensure_indexes(self):
+        """Create the indexes backing the date-range and per-post queries (no-op if present)"""
+        self.posts_collection.create_indexes([
+            IndexModel([("subreddit", ASCENDING), ("created_at", DESCENDING)])
+        ])
+        self.comments_collection.create_indexes([
+            IndexModel([("subreddit", ASCENDING), ("created_at", DESCENDING)]),
+            # Serves find({post_id}).sort("score", -1).limit(n) straight from the index
+            IndexModel([("post_id", ASCENDING), ("score", DESCENDING)])
+        ])
+        # Unique Reddit IDs make re-inserting an already stored post or comment
+        # an index lookup that fails fast instead of a duplicate document
+        for collection in (self.posts_collection, self.comments_collection):
+            try:
+                collection.create_index("id", unique=True)
+            except OperationFailure as e:
+                # Existing duplicates block the unique index; queries still work without it
+                logger.warning(f"Could not create unique index on {collection.name}.id: {e}")
+    
+    def create_vector_indexes(self):
+        """Create (or update) the scalar-quantized Atlas Vector Search indexes"""
+        for collection_name, (index_name, filter_paths) in VECTOR_INDEXES.items():
+            collection = self.db[collection_name]
+            definition = {
+                "fields": [
+                    {
+                        "type": "vector",
+                        "path": "embedding",
+                        "numDimensions": EMBEDDING_DIMENSIONS,
+                        "similarity": "cosine",
+                        "quantization": "scalar"
+                    }
+                ] + [{"type": "filter", "path": path} for path in filter_paths]
+            }
+            
+            if list(collection.list_search_indexes(index_name)):
+                collection.update_search_index(index_name, definition)
+                logger.info("Updated vector index %s", index_name)
+            else:
+                collection.create_search_index(
+                    SearchIndexModel(definition=definition, name=index_name, type="vectorSearch")
+                )
+                logger.info("Created vector index %s", index_name)
+    
     def close(self):
         """Close MongoDB connection"""
+        global _shared_connection
         if self.client:
             self.client.close()
             logger.info("MongoDB connection closed")
+        # A closed shared connection is replaced on the next get_mongo_connection()
+        with _shared_connection_lock:
+            if _shared_connection is self:
+                _shared_connection = None
+
+_shared_connection: Optional[MongoDBConnection] = None
+_shared_connection_lock = threading.Lock()
+
+def get_mongo_connection() -> MongoDBConnection:
+    """Process-wide MongoDB connection, created on first use and reused after"""
+    global _shared_connection
+    if _shared_connection is None:
+        with _shared_connection_lock:
+            if _shared_connection is None:
+                _shared_connection = MongoDBConnection()
+    return _shared_connection
+
+# One model per device, shared by everything in the process
+_embedding_models: Dict[str, SentenceTransformer] = {}
+_embedding_model_lock = threading.Lock()
+_embedding_cache: Optional[EmbeddingCache] = None
+
+def _create_embedding_model(device: str) -> SentenceTransformer:
+    """Build the sentence transformer for the configured backend on a device"""
+    if EMBEDDING_BACKEND == "onnx" and device == "cpu":
+        try:
+            model = SentenceTransformer(
+                EMBEDDING_MODEL_NAME,
+                device=device,
+                cache_folder=EMBEDDING_CACHE_DIR,
+                backend="onnx",
+                model_kwargs={"file_name": ONNX_MODEL_FILE}
+            )
+            model.max_seq_length = EMBED_MAX_TOKENS
+            return model
+        except Exception as e:
+            logger.warning(f"ONNX backend unavailable, falling back to PyTorch: {e}")
+    
+    # safetensors weights are memory-mapped on load instead of unpickled
+    model = SentenceTransformer(
+        EMBEDDING_MODEL_NAME,
+        device=device,
+        cache_folder=EMBEDDING_CACHE_DIR,
+        model_kwargs={"use_safetensors": True}
+    )
+    if device.startswith("cuda"):
+        # FP16 weights run on tensor cores and halve GPU memory
+        model.half()
+    model.max_seq_length = EMBED_MAX_TOKENS
+    return model
+
+def load_embedding_model(device: Optional[str] = None) -> SentenceTransformer:
+    """
+    Process-wide embedding model, loaded on first use and shared after.
+    
+    Args:
+        device (Optional[str]): Torch device; defaults to CUDA when available, else CPU
+    """
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    if device not in _embedding_models:
+        with _embedding_model_lock:
+            if device not in _embedding_models:
+                if device == "cpu":
+                    torch.set_num_threads(EMBEDDING_THREADS)
+                    try:
+                        torch.set_num_interop_threads(1)
+                    except RuntimeError:
+                        pass  # Only settable before torch's first parallel work
+                logger.info("Loading embedding model on %s...", device)
+                _embedding_models[device] = _create_embedding_model(device)
+                logger.info("Embedding model loaded successfully")
+    return _embedding_models[device]
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide embedding cache, opened on first use"""
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _embedding_model_lock:
+            if _embedding_cache is None:
+                # Everything that changes the stored vectors is part of the key
+                backend = f"onnx:{ONNX_MODEL_FILE}" if EMBEDDING_BACKEND == "onnx" else EMBEDDING_BACKEND
+                fingerprint = f"{EMBEDDING_MODEL_NAME}|{backend}|normalized|{EMBED_MAX_TOKENS}|{MAX_EMBED_CHARS}"
+                _embedding_cache = EmbeddingCache(EMBEDDING_STORE_PATH, fingerprint)
+    return _embedding_cache
+
+@lru_cache(maxsize=1024)
+def _cached_query_embedding(model: SentenceTransformer, query: str) -> Tuple[float, ...]:
+    """Encode a search query; a tuple so the LRU cache can hold it"""
+    return tuple(model.encode(query[:MAX_EMBED_CHARS], normalize_embeddings=True).tolist())
 
 class RedditDataManager:
-    def __init__(self):
-        self.mongo = MongoDBConnection()
+    def __init__(self, device: Optional[str] = None):
+        self.mongo = get_mongo_connection()
         self.embedding_model = None
-        self._load_embedding_model()
+        self._load_embedding_model(device)
     
-    def _load_embedding_model(self):
+    def _load_embedding_model(self, device: Optional[str] = None):
         """Load the sentence transformer model for embeddings"""
         try:
-            logger.info("Loading embedding model...")
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-            logger.info("Embedding model loaded successfully")
+            self.embedding_model = load_embedding_model(device)
         except Exception as e:
             logger.error(f"Failed to load embedding model: {e}")
             raise
     
     def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for text using sentence transformers"""
-        try:
-            if not text or text.strip() == "":
-                return [0.0] * 384  # Return zero vector for empty text
-            
-            # Truncate very long texts to avoid memory issues
-            if len(text) > 1000:
-                text = text[:1000]
-            
-            embedding = self.embedding_model.encode(text)
-            return embedding.tolist()
+        """Generate embedding for text using sentence transformers (a batch of one)"""
+        return self.generate_embeddings_batch([text])[0].tolist()
+    
+    def generate_embeddings_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate embeddings for many texts with a single encode call.
+        
+        Args:
+            texts (List[str]): Texts to embed; empty ones get the zero vector
             
-        except Exception as e:
-            logger.error(f"Failed to generate embedding: {e}")
-            return [0.0] * 384
+        Returns:
+            np.ndarray: float32 array of shape (len(texts), 384)
+        """
+        embeddings = np.zeros((len(texts), EMBEDDING_DIMENSIONS), dtype=np.float32)
+        
+        # Each distinct (truncated) text is encoded once and its embedding is
+        # scattered back to every row it appears in; empty texts stay zero
+        unique_texts = {}
+        rows = []
+        unique_rows = []
+        for i, text in enumerate(texts):
+            if text and text.strip():
+                rows.append(i)
+                unique_rows.append(unique_texts.setdefault(text[:MAX_EMBED_CHARS], len(unique_texts)))
+        if not rows:
+            return embeddings
+        
+        # Texts embedded before (this run or an earlier one) come from the
+        # cache; only the rest are encoded
+        cache = get_embedding_cache()
+        cached = cache.get_many(list(unique_texts))
+        unique_embeddings = np.zeros((len(unique_texts), EMBEDDING_DIMENSIONS), dtype=np.float32)
+        to_encode = []
+        to_encode_rows = []
+        for text, row in unique_texts.items():
+            if text in cached:
+                unique_embeddings[row] = cached[text]
+            else:
+                to_encode.append(text)
+                to_encode_rows.append(row)
+        
+        # encode() already length-sorts its input before slicing mini-batches
+        # (SBERT smart batching) and restores the original order afterwards,
+        # so passing the whole list in one call keeps padding to a minimum
+        if to_encode:
+            try:
+                encoded = self.embedding_model.encode(
+                    to_encode,
+                    batch_size=GPU_EMBED_BATCH_SIZE if self.embedding_model.device.type == "cuda" else EMBED_BATCH_SIZE,
+                    show_progress_bar=False,
+                    # Unit length, so cosine similarity downstream is a plain dot product
+                    normalize_embeddings=True
+                )
+                unique_embeddings[to_encode_rows] = encoded
+                cache.put_many(to_encode, encoded)
+            except Exception as e:
+                logger.error("Failed to generate embeddings batch of %d texts: %s", len(texts), e)
+        embeddings[rows] = unique_embeddings[unique_rows]
+        return embeddings
+    
+    def embed_query(self, query: str) -> List[float]:
+        """Embedding for a search query; repeated queries come from an LRU cache"""
+        if not query or query.strip() == "":
+            return [0.0] * EMBEDDING_DIMENSIONS
+        return list(_cached_query_embedding(self.embedding_model, query))
     
 
     def insert_insight(self, data: Dict) -> str:
@@ -95,6 +455,26 @@ class RedditDataManager:
             raise
 
 
+    def _insert_many_unordered(self, collection: Collection, docs: List[Dict], label: str) -> List[str]:
+        """
+        Insert documents without ordering, so one bad document (e.g. a duplicate
+        key) doesn't abort the rest of the batch. Returns the IDs that were inserted.
+        """
+        try:
+            result = collection.insert_many(docs, ordered=False)
+            #logger.info(f"Inserted {len(result.inserted_ids)} {label}")
+            return [str(id) for id in result.inserted_ids]
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            failed = {error["index"] for error in write_errors}
+            # Duplicate keys (code 11000) are documents already stored by an
+            # earlier run and are skipped quietly; anything else is worth a warning
+            other_errors = [error for error in write_errors if error.get("code") != DUPLICATE_KEY_ERROR]
+            if other_errors:
+                logger.warning("Skipped %d of %d %s that failed to insert: %s", len(other_errors), len(docs), label, other_errors[0].get('errmsg'))
+            # insert_many assigns _id to each document before sending it
+            return [str(doc["_id"]) for i, doc in enumerate(docs) if i not in failed]
+
     def insert_post(self, post_data: Dict) -> str:
         """Insert a single post into the database"""
         try:
@@ -112,18 +492,65 @@ class RedditDataManager:
     def insert_posts_batch(self, posts_data: List[Dict]) -> List[str]:
         """Insert multiple posts in a batch"""
         try:
-            # Add metadata to all posts
+            # Add metadata to all posts; the whole batch shares one insert time
+            inserted_at = datetime.now(timezone.utc)
+            fromtimestamp = datetime.fromtimestamp
             for post in posts_data:
-                post['created_at'] = datetime.fromtimestamp(post['created_utc'])
-                post['inserted_at'] = datetime.now(timezone.utc)
+                post['created_at'] = fromtimestamp(post['created_utc'])
+                post['inserted_at'] = inserted_at
             
-            result = self.mongo.posts_collection.insert_many(posts_data)
-            #logger.info(f"Inserted {len(result.inserted_ids)} posts")
-            return [str(id) for id in result.inserted_ids]
+            return self._insert_many_unordered(self.mongo.posts_collection, posts_data, "posts")
         except Exception as e:
             logger.error(f"Failed to insert posts batch: {e}")
             raise
     
+    def _bulk_upsert(self, collection: Collection, docs: List[Dict], label: str) -> int:
+        """
+        Upsert documents by Reddit ID in unordered bulk writes, so re-crawled
+        posts and comments are refreshed (score, num_comments, ...) rather than
+        rejected as duplicates. Returns how many documents were written.
+        """
+        # The whole call shares one insert time, set only on first insert
+        inserted_at = datetime.now(timezone.utc)
+        fromtimestamp = datetime.fromtimestamp
+        written = 0
+        for start in range(0, len(docs), BULK_WRITE_CHUNK):
+            requests = []
+            for doc in docs[start:start + BULK_WRITE_CHUNK]:
+                doc['created_at'] = fromtimestamp(doc['created_utc'])
+                requests.append(UpdateOne(
+                    {"id": doc["id"]},
+                    {"$set": doc, "$setOnInsert": {"inserted_at": inserted_at}},
+                    upsert=True
+                ))
+            try:
+                result = collection.bulk_write(requests, ordered=False)
+                written += result.upserted_count + result.matched_count
+            except BulkWriteError as e:
+                write_errors = e.details.get("writeErrors", [])
+                written += e.details.get("nUpserted", 0) + e.details.get("nMatched", 0)
+                # A duplicate key here is two concurrent upserts of the same ID; the other one won
+                other_errors = [error for error in write_errors if error.get("code") != DUPLICATE_KEY_ERROR]
+                if other_errors:
+                    logger.warning("Failed to upsert %d of %d %s: %s", len(other_errors), len(requests), label, other_errors[0].get('errmsg'))
+        return written
+    
+    def bulk_upsert_posts(self, posts_data: List[Dict]) -> int:
+        """Insert or refresh many posts by ID; returns how many were written"""
+        try:
+            return self._bulk_upsert(self.mongo.posts_collection, posts_data, "posts")
+        except Exception as e:
+            logger.error(f"Failed to upsert posts batch: {e}")
+            raise
+    
+    def bulk_upsert_comments(self, comments_data: List[Dict]) -> int:
+        """Insert or refresh many comments by ID; returns how many were written"""
+        try:
+            return self._bulk_upsert(self.mongo.comments_collection, comments_data, "comments")
+        except Exception as e:
+            logger.error(f"Failed to upsert comments batch: {e}")
+            raise
+    
     def insert_comment(self, comment_data: Dict) -> str:
         """Insert a single comment into the database"""
         try:
@@ -141,14 +568,14 @@ class RedditDataManager:
     def insert_comments_batch(self, comments_data: List[Dict]) -> List[str]:
         """Insert multiple comments in a batch"""
         try:
-            # Add metadata to all comments
+            # Add metadata to all comments; the whole batch shares one insert time
+            inserted_at = datetime.now(timezone.utc)
+            fromtimestamp = datetime.fromtimestamp
             for comment in comments_data:
-                comment['created_at'] = datetime.fromtimestamp(comment['created_utc'])
-                comment['inserted_at'] = datetime.now(timezone.utc)
+                comment['created_at'] = fromtimestamp(comment['created_utc'])
+                comment['inserted_at'] = inserted_at
             
-            result = self.mongo.comments_collection.insert_many(comments_data)
-            #logger.info(f"Inserted {len(result.inserted_ids)} comments")
-            return [str(id) for id in result.inserted_ids]
+            return self._insert_many_unordered(self.mongo.comments_collection, comments_data, "comments")
         except Exception as e:
             logger.error(f"Failed to insert comments batch: {e}")
             raise
@@ -161,7 +588,7 @@ class RedditDataManager:
                 query['subreddit'] = subreddit
             
             posts = list(self.mongo.posts_collection.find(query).sort('created_at', -1))
-            logger.info(f"Retrieved {len(posts)} posts for subreddit: {subreddit if subreddit else 'all'}")
+            logger.info("Retrieved %d posts for subreddit: %s", len(posts), subreddit or 'all')
             return posts
         except Exception as e:
             logger.error(f"Failed to get all posts: {e}")
@@ -175,7 +602,7 @@ class RedditDataManager:
                 query['subreddit'] = subreddit
             
             comments = list(self.mongo.comments_collection.find(query).sort('created_at', -1))
-            logger.info(f"Retrieved {len(comments)} comments for subreddit: {subreddit if subreddit else 'all'}")
+            logger.info("Retrieved %d comments for subreddit: %s", len(comments), subreddit or 'all')
             return comments
         except Exception as e:
             logger.error(f"Failed to get all comments: {e}")
@@ -185,12 +612,27 @@ class RedditDataManager:
         """Get all comments for a specific post"""
         try:
             comments = list(self.mongo.comments_collection.find({"post_id": "t3_" + post_id}).sort('created_at', -1))
-            logger.info(f"Retrieved {len(comments)} comments for post ID: {post_id}")
+            logger.info("Retrieved %d comments for post ID: %s", len(comments), post_id)
             return comments
         except Exception as e:
             logger.error(f"Failed to get comments for post {post_id}: {e}")
             raise
     
+    def get_all_comments_for_posts(self, post_ids: List[str]) -> Dict[str, List[Dict]]:
+        """Get all comments for many posts with one query, keyed by post ID"""
+        try:
+            comments_by_post = {post_id: [] for post_id in post_ids}
+            cursor = self.mongo.comments_collection.find(
+                {"post_id": {"$in": ["t3_" + post_id for post_id in post_ids]}}
+            ).sort('created_at', -1)
+            for comment in cursor:
+                comments_by_post[comment["post_id"][3:]].append(comment)
+            logger.info("Retrieved comments for %d posts", len(post_ids))
+            return comments_by_post
+        except Exception as e:
+            logger.error(f"Failed to get comments for {len(post_ids)} posts: {e}")
+            raise
+    
     def get_all_authors(self, posts: List[dict]) -> List[str]: #, comments: List[dict]
         """
         Given lists of post and comment dicts, return a list of all author user IDs found.
@@ -223,7 +665,7 @@ class RedditDataManager:
             }
             
             posts = list(self.mongo.posts_collection.find(query).sort('created_at', -1))
-            logger.info(f"Retrieved {len(posts)} posts for {subreddit} between {start_date} and {end_date}")
+            logger.info("Retrieved %d posts for %s between %s and %s", len(posts), subreddit, start_date, end_date)
             return posts
         except Exception as e:
             logger.error(f"Failed to get posts by date range: {e}")
@@ -241,12 +683,62 @@ class RedditDataManager:
             }
             
             comments = list(self.mongo.comments_collection.find(query).sort('created_at', -1))
-            logger.info(f"Retrieved {len(comments)} comments for {subreddit} between {start_date} and {end_date}")
+            logger.info("Retrieved %d comments for %s between %s and %s", len(comments), subreddit, start_date, end_date)
             return comments
         except Exception as e:
             logger.error(f"Failed to get comments by date range: {e}")
             raise
     
+    def get_comments_as_arrays(self, subreddit: str, start_date: datetime, end_date: datetime) -> Dict:
+        """
+        Get embedded comments within a date range as column arrays for numeric work.
+        
+        Returns:
+            Dict: {"embedding": float32 (n, 384), "score": int32 (n,),
+                   "created_at": datetime64[s] (n,), "body": list of n strings}
+        """
+        try:
+            query = {
+                'subreddit': subreddit,
+                'created_at': {
+                    '$gte': start_date,
+                    '$lte': end_date
+                },
+                'embedding': {'$exists': True, '$ne': []}
+            }
+            
+            # Size the arrays up front, then fill them straight from the cursor
+            n = self.mongo.comments_collection.count_documents(query)
+            embeddings = np.empty((n, EMBEDDING_DIMENSIONS), dtype=np.float32)
+            scores = np.empty(n, dtype=np.int32)
+            created_at = np.empty(n, dtype='datetime64[s]')
+            bodies = []
+            
+            # limit(0) would mean "no limit", so skip the read when nothing matched
+            if n:
+                cursor = self.mongo.comments_collection.find(
+                    query, {"embedding": 1, "score": 1, "created_at": 1, "body": 1, "_id": 0}
+                ).sort('created_at', -1).limit(n)
+                
+                for i, comment in enumerate(cursor):
+                    embeddings[i] = embedding_from_bson(comment["embedding"])
+                    scores[i] = comment.get("score", 0)
+                    created_at[i] = comment["created_at"]
+                    bodies.append(comment.get("body", ""))
+            
+            # Comments deleted between the count and the read leave unused rows
+            n = len(bodies)
+            logger.info("Retrieved %d comment arrays for %s between %s and %s", n, subreddit, start_date, end_date)
+            return {
+                "embedding": embeddings[:n],
+                "score": scores[:n],
+                "created_at": created_at[:n],
+                "body": bodies
+            }
+        except Exception as e:
+            logger.error(f"Failed to get comment arrays by date range: {e}")
+            raise
+    
     def get_post_with_comments(self, post_id: str) -> Dict:
         """Get a post with all its comments for comprehensive analysis"""
         try:
@@ -272,19 +764,20 @@ class RedditDataManager:
     def get_combined_content_for_analysis(self, post_id: str) -> str:
         """Get combined post + comments content for LLM analysis"""
         try:
-            post_data = self.get_post_with_comments(post_id)
-            if not post_data:
+            post = self.mongo.posts_collection.find_one(
+                {"id": post_id}, {"title": 1, "selftext": 1, "_id": 0}
+            )
+            if post is None:
                 return ""
             
-            post = post_data["post"]
-            comments = post_data["comments"]
-            
             # Combine post content
             post_content = f"POST: {post.get('title', '')} {post.get('selftext', '')}"
             
-            # Add top comments (by score)
-            sorted_comments = sorted(comments, key=lambda x: x.get('score', 0), reverse=True)
-            top_comments = sorted_comments[:10]  # Top 10 comments
+            # Add top comments (by score); only the top 10 leave the database,
+            # served by the (post_id, score) index
+            top_comments = self.mongo.comments_collection.find(
+                {"post_id": post_id}, {"body": 1, "_id": 0}
+            ).sort("score", -1).limit(10)
             
             comment_content = "\n".join([f"COMMENT: {comment.get('body', '')}" for comment in top_comments])
             
@@ -293,17 +786,19 @@ class RedditDataManager:
             logger.error(f"Failed to get combined content for {post_id}: {e}")
             return ""
     
-    def search_posts_and_comments(self, query: str, subreddit: str, limit: int = 5) -> Dict:
+    def search_posts_and_comments(self, query: str, subreddit: str, limit: int = 5, comments_per_post: int = 3) -> Dict:
         """
         Search posts first, then get comments for those specific posts.
         This ensures comments are related to the posts in the results.
+        
+        Runs as a single aggregate: the post vector search joins each hit's
+        top comments (by score) with $lookup, so it costs one round trip.
         """
         try:
             # Generate query embedding
-            query_embedding = self.generate_embedding(query)
+            query_embedding = self.embed_query(query)
             
-            # Search posts first
-            posts_pipeline = [
+            pipeline = [
                 {
                     "$vectorSearch": {
                         "index": "posts_vector_idx",
@@ -314,48 +809,39 @@ class RedditDataManager:
                         "filter": {"subreddit": subreddit}
                     }
                 },
+                {
+                    # Served by the (post_id, score) index on comments
+                    "$lookup": {
+                        "from": "comments",
+                        "localField": "id",
+                        "foreignField": "post_id",
+                        "pipeline": [
+                            {"$match": {"subreddit": subreddit}},
+                            {"$sort": {"score": -1}},
+                            {"$limit": comments_per_post},
+                            {"$project": {"id": 1, "body": 1, "post_id": 1, "score": 1, "created_at": 1, "author": 1}}
+                        ],
+                        "as": "top_comments"
+                    }
+                },
                 {
                     "$project": {
-                        "id": 1, "title": 1, "score": 1, "created_at": 1, "author": 1,
+                        "id": 1, "title": 1, "score": 1, "created_at": 1, "author": 1, "top_comments": 1,
                         "similarity_score": {"$meta": "vectorSearchScore"}
                     }
                 }
             ]
             
-            posts_results = list(self.mongo.posts_collection.aggregate(posts_pipeline))
+            posts_results = list(self.mongo.posts_collection.aggregate(pipeline))
+            
+            # Split the joined comments back out of their posts
+            comments_results = []
+            for post in posts_results:
+                comments_results.extend(post.pop("top_comments"))
             
             # Get post IDs from the results
             post_ids = [post["id"] for post in posts_results]
             
-            # Get comments for these specific posts
-            comments_results = []
-            if post_ids:
-                comments_pipeline = [
-                    {
-                        "$match": {
-                            "post_id": {"$in": post_ids},
-                            "subreddit": subreddit
-                        }
-                    },
-                    {
-                        "$vectorSearch": {
-                            "index": "comments_vector_idx",
-                            "path": "embedding",
-                            "queryVector": query_embedding,
-                            "numCandidates": limit * 20,  # More candidates since we're filtering by post_id
-                            "limit": limit * 3  # More comments since we're filtering by post_id
-                        }
-                    },
-                    {
-                        "$project": {
-                            "id": 1, "body": 1, "post_id": 1, "score": 1, "created_at": 1, "author": 1,
-                            "similarity_score": {"$meta": "vectorSearchScore"}
-                        }
-                    }
-                ]
-                
-                comments_results = list(self.mongo.comments_collection.aggregate(comments_pipeline))
-            
             return {
                 "query": query,
                 "posts": posts_results,
@@ -368,6 +854,69 @@ class RedditDataManager:
             logger.error(f"Failed to search posts and comments: {e}")
             return {"posts": [], "comments": [], "total_posts": 0, "total_comments": 0, "related_posts": []}
     
+    def search_and_count(self, query: str, subreddit: str, start_date: datetime, end_date: datetime, limit: int = 5) -> Dict:
+        """
+        Vector-search posts and count/average the subreddit's posts in a date range,
+        in a single aggregate round trip.
+        """
+        try:
+            query_embedding = self.embed_query(query)
+            
+            # $vectorSearch isn't allowed inside $facet, so the date-range stats
+            # run as the main pipeline and the search is unioned in after them
+            pipeline = [
+                {
+                    "$match": {
+                        "subreddit": subreddit,
+                        "created_at": {"$gte": start_date, "$lte": end_date}
+                    }
+                },
+                {"$group": {"_id": None, "total": {"$sum": 1}, "avg_score": {"$avg": "$score"}}},
+                {"$set": {"_stats": True}},
+                {
+                    "$unionWith": {
+                        "coll": "posts",
+                        "pipeline": [
+                            {
+                                "$vectorSearch": {
+                                    "index": "posts_vector_idx",
+                                    "path": "embedding",
+                                    "queryVector": query_embedding,
+                                    "numCandidates": limit * 10,
+                                    "limit": limit,
+                                    "filter": {"subreddit": subreddit}
+                                }
+                            },
+                            {
+                                "$project": {
+                                    "id": 1, "title": 1, "score": 1, "created_at": 1, "author": 1,
+                                    "similarity_score": {"$meta": "vectorSearchScore"}
+                                }
+                            }
+                        ]
+                    }
+                }
+            ]
+            
+            stats = {"total": 0, "avg_score": None}
+            posts_results = []
+            for doc in self.mongo.posts_collection.aggregate(pipeline):
+                if doc.get("_stats"):
+                    stats = doc
+                else:
+                    posts_results.append(doc)
+            
+            return {
+                "query": query,
+                "posts": posts_results,
+                "total_posts": len(posts_results),
+                "posts_in_range": stats["total"],
+                "avg_score_in_range": stats["avg_score"]
+            }
+        except Exception as e:
+            logger.error(f"Failed to search and count posts: {e}")
+            return {"posts": [], "total_posts": 0, "posts_in_range": 0, "avg_score_in_range": None}
+    
     def search_posts_with_top_comments(self, query: str, subreddit: str, limit: int = 5, comments_per_post: int = 3) -> Dict:
         """
         Search posts and return each post with its top comments (by score).
@@ -375,7 +924,7 @@ class RedditDataManager:
         """
         try:
             # Generate query embedding
-            query_embedding = self.generate_embedding(query)
+            query_embedding = self.embed_query(query)
             
             # Search posts first
             posts_pipeline = [
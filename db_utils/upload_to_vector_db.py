@@ -1,9 +1,14 @@
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from post_utils.redditCaller import RedditCaller
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from post_utils.redditCaller import COMMENT_FETCH_WORKERS, EMBED_BATCH_SIZE, RedditCaller
 from tqdm import tqdm
 
+# Bulk writes queued on the writer thread before the pipeline waits for one
+MAX_PENDING_WRITES = 4
+
 def main():
     """Main function - complete pipeline for fetching, processing, and storing Reddit data"""
     caller = None
@@ -24,46 +29,78 @@ def main():
         stored_comments = 0
         errors = []
 
-        for post in tqdm(posts):
+        # The pipeline's stages overlap: comment fetching runs on a thread pool,
+        # embedding runs on this thread, and MongoDB writes run on one writer
+        # thread, so each batch is stored while the next one is being encoded
+        writes = deque()
+
+        def collect_write(write):
+            nonlocal stored_posts, stored_comments
+            kind, count, future = write
             try:
-                #print(f"Processing post {i}/{len(posts)}: {post['title'][:50]}...")
-                
-                # Process post with embedding
-                processed_post = caller.process_post(post)
-                
-                # Store post in database
-                caller.db_manager.insert_post(processed_post)
-                stored_posts += 1
-                #print(f"Stored post: {post['id']}")
-                
-                # Step 3: Fetch comments for this post
-                #print(f"Fetching comments for post {post['id']}...")
-                comments = caller.fetch_comments(post['id'])
-                #print(f"Found {len(comments)} comments")
-                
-                # Step 4: Process and store comments
-                for comment in comments:
-                    try:
-                        # Process comment with embedding
-                        processed_comment = caller.process_comment(comment)
-                        
-                        # Store comment in database
-                        caller.db_manager.insert_comment(processed_comment)
-                        stored_comments += 1
-                        
-                    except Exception as e:
-                        error_msg = f"Failed to process comment {comment.get('id', 'unknown')}: {e}"
-                        print(f"{error_msg}")
-                        errors.append(error_msg)
-                
-                # Rate limiting - be respectful to Reddit's API
-                import time
-                time.sleep(1)
-                
+                stored = future.result()
+                if kind == "posts":
+                    stored_posts += stored
+                else:
+                    stored_comments += stored
+                if stored < count:
+                    errors.append(f"Skipped {count - stored} of {count} {kind} in a batch")
             except Exception as e:
-                error_msg = f"Failed to process post {post.get('id', 'unknown')}: {e}"
+                error_msg = f"Failed to store a batch of {count} {kind}: {e}"
                 print(f"{error_msg}")
                 errors.append(error_msg)
+
+        def submit_write(kind, upsert, docs):
+            writes.append((kind, len(docs), writer.submit(upsert, docs)))
+            # Bound the backlog so finished batches don't pile up in memory
+            while len(writes) > MAX_PENDING_WRITES:
+                collect_write(writes.popleft())
+
+        # Comments are pooled across posts so every encode/insert gets a full batch
+        pending_comments = []
+
+        def flush_comments():
+            try:
+                # A copy, since the writer thread still reads it after the clear below
+                processed_comments = caller.process_comments(list(pending_comments))
+                submit_write("comments", caller.db_manager.bulk_upsert_comments, processed_comments)
+            except Exception as e:
+                error_msg = f"Failed to embed a batch of {len(pending_comments)} comments: {e}"
+                print(f"{error_msg}")
+                errors.append(error_msg)
+            finally:
+                pending_comments.clear()
+
+        with ThreadPoolExecutor(max_workers=COMMENT_FETCH_WORKERS) as executor, ThreadPoolExecutor(max_workers=1) as writer:
+            # Step 3: Start fetching comments for all posts before embedding the
+            # posts, so the HTTP requests are in flight during the encode
+            futures = {executor.submit(caller.fetch_comments, post['id']): post for post in posts}
+
+            # Embed every post in one batch and upsert them in bulk; posts
+            # already stored by an earlier run get their score and counts refreshed
+            processed_posts = caller.process_posts(posts)
+            submit_write("posts", caller.db_manager.bulk_upsert_posts, processed_posts)
+
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                post = futures[future]
+                try:
+                    comments = future.result()
+                    #print(f"Found {len(comments)} comments")
+                    
+                    # Step 4: Process and store comments once a full batch is pending
+                    pending_comments.extend(comments)
+                    if len(pending_comments) >= EMBED_BATCH_SIZE:
+                        flush_comments()
+                    
+                except Exception as e:
+                    error_msg = f"Failed to fetch comments for post {post.get('id', 'unknown')}: {e}"
+                    print(f"{error_msg}")
+                    errors.append(error_msg)
+
+            if pending_comments:
+                flush_comments()
+            while writes:
+                collect_write(writes.popleft())
         
         # Final summary
         print(f"\nPipeline Complete!")
@@ -1,127 +1,368 @@
 import os
 import sys
 import asyncio
-import ast
+from dataclasses import dataclass, field
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+import orjson
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_utils.database import RedditDataManager
-from unwrap_openai.unwrap_openai import summarize_post, summarize_comments, generalize_insights
-from tqdm import tqdm
+from db_utils.database import RedditDataManager, embedding_from_bson
+from unwrap_openai.unwrap_openai import GPT5Deployment, content_length, summarize_posts_batch, summarize_comments, generalize_insights
+from insight_creation.insight_cache import cached
+from tqdm.asyncio import tqdm_asyncio
 import pandas as pd
 
+try:
+  import simsimd
+except ImportError:  # simsimd is optional; fall back to a NumPy dot product
+  simsimd = None
+
+# Cluster insights on the GPU with cuML when USE_GPU=true and RAPIDS is installed
+USE_GPU = os.getenv("USE_GPU", "false").lower() == "true"
+if USE_GPU:
+  try:
+    import cupy
+    from cuml import KMeans
+  except ImportError:
+    print("[WARN] cuML not available, clustering insights on the CPU")
+    USE_GPU = False
+if not USE_GPU:
+  from sklearn.cluster import MiniBatchKMeans
+
 dbManager = RedditDataManager()
 
-async def create_insights(post_data):
-  post_summaries = []
-  post_comments_summaries = []
-  mentions = []
-  for post in tqdm(post_data):
-    post_id = post.get("id")
-    title = post.get("title")
-    selftext = post.get("selftext")
-    subreddit = post.get("subreddit")
-    created_utc = post.get("created_utc")
-    score = post.get("score")
-    num_comments = post.get("num_comments")
-    author = post.get("author")
-    url = post.get("url")
-    stickied = post.get("stickied")
-    embedding = post.get("embedding")
-    created_at = post.get("created_at")
-    inserted_at = post.get("inserted_at")
-    mentions.append({
-      "post_id": post_id,
-      "post_title": title,
-      "post_body": selftext,
-      "data_posted": created_utc,
-      "score": score,
-      "num_comments": num_comments,
-      "author": author,
-      "url": url,
-    })
-    post_comments = dbManager.get_all_comments_for_post(post_id)
-
-    comment_embeddings = [comment.get("embedding") for comment in post_comments if comment.get("embedding")]
-    similarity_score = cosine_similarity(comment_embeddings, [embedding]) if comment_embeddings else []
-
-    average_similarity = similarity_score.mean() if len(similarity_score) > 0 else 0.0
-    #print(f"Average similarity between comments and post: {average_similarity:.4f}")
-
-    post_text = f"{title}\n\n{selftext}"
-    post_summary = await summarize_post(post_text)
+# Posts processed at once; OpenAI calls are additionally capped by unwrap_openai's semaphore
+POST_CONCURRENCY = 20
+
+# Comment text sent per post for sentiment; more than this adds token cost, not signal
+MAX_COMMENT_CHARS = 30000
+# Below this much comment text (letters/digits) there's no sentiment to read
+MIN_COMMENT_CHARS = 50
+
+# Posts whose stored embeddings are at least this similar (reposts, crossposts,
+# copy-pasted complaints) share one summarize_post call within a run
+SEMANTIC_DUPLICATE_THRESHOLD = 0.97
+
+# Posts summarized per OpenAI request, and a cap on their combined text
+# (~6k tokens) so one long selftext doesn't blow up a whole batch
+SUMMARIZE_BATCH_SIZE = 10
+SUMMARIZE_BATCH_CHARS = 24000
+# How long a partly filled batch waits for more posts before it is sent
+SUMMARIZE_BATCH_DELAY = 0.05
+
+class MicroBatcher:
+  """Collect single-item async calls into batched calls of batch_fn.
+
+  Each submit() waits until the batch is full (max_items or max_chars of text) or
+  `delay` seconds pass, then gets its own element of batch_fn's result list.
+  """
+
+  def __init__(self, batch_fn, max_items, max_chars, delay):
+    self.batch_fn = batch_fn
+    self.max_items = max_items
+    self.max_chars = max_chars
+    self.delay = delay
+    self.pending = []
+    self.pending_chars = 0
+    self.timer = None
+
+  async def submit(self, text):
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    self.pending.append((text, future))
+    self.pending_chars += len(text)
+    if len(self.pending) >= self.max_items or self.pending_chars >= self.max_chars:
+      self.flush()
+    elif self.timer is None:
+      self.timer = loop.call_later(self.delay, self.flush)
+    return await future
+
+  def flush(self):
+    if self.timer is not None:
+      self.timer.cancel()
+      self.timer = None
+    batch, self.pending, self.pending_chars = self.pending, [], 0
+    if batch:
+      asyncio.ensure_future(self._run(batch))
+
+  async def _run(self, batch):
     try:
-        parsed_summary = ast.literal_eval(post_summary)
-        if isinstance(parsed_summary, list):
-            post_summaries.append(parsed_summary)
-        else:
-            post_summaries.append([])
-    except (ValueError, SyntaxError):
-        post_summaries.append([])
-    post_text = f"Post: {post_text}\n"
-    if len(post_comments) > 0:
-      comments_text = "\n".join([comment.get("body", "") for comment in post_comments])
-      text = post_text + f"Comments:\n{comments_text}"
-      comments_summary = await summarize_comments(text)
-      post_comments_summaries.append(comments_summary)
-    else:
-      comments_summary = "N/A"
-      post_comments_summaries.append(comments_summary)
+      results = await self.batch_fn([text for text, _ in batch])
+    except Exception as e:
+      for _, future in batch:
+        future.set_exception(e)
+      return
+    for (_, future), result in zip(batch, results):
+      future.set_result(result)
+
+# OpenAI results are cached on disk by input hash; the fallbacks returned on
+# API errors are not cached so they get retried next run. Cache misses are
+# summarized SUMMARIZE_BATCH_SIZE posts per request
+_OPENAI_MODEL = GPT5Deployment.GPT_5_NANO.value
+summarize_post = cached("summarize_post_json", _OPENAI_MODEL, skip=('{"insights": []}',))(
+  MicroBatcher(summarize_posts_batch, SUMMARIZE_BATCH_SIZE, SUMMARIZE_BATCH_CHARS, SUMMARIZE_BATCH_DELAY).submit
+)
+summarize_comments = cached("summarize_comments", _OPENAI_MODEL, skip=("N/A",))(summarize_comments)
+generalize_insights = cached("generalize_insights", _OPENAI_MODEL)(generalize_insights)
+
+@dataclass(slots=True)
+class PostInsight:
+  """One distinct insight text and the post mentions that produced it."""
+  insight: str
+  mentions: list = field(default_factory=list)
+
+  @property
+  def num_mentions(self):
+    return len(self.mentions)
+
+def quantize_int8(X):
+  """Scale each row of X so its largest component is +-127 and round to int8."""
+  X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+  scale = np.abs(X).max(axis=1, keepdims=True)
+  scale[scale == 0] = 1
+  return np.round(X * (127 / scale)).astype(np.int8)
+
+def mean_cosine_similarity(embeddings, embedding):
+  """Average cosine similarity between each row of embeddings and one embedding.
+
+  Embeddings are stored unit-length, so without simsimd cosine similarity is
+  just a NumPy dot product. With simsimd the vectors are quantized to int8
+  first (a quarter of the memory traffic) and scored with its int8 cosine
+  kernel; cosine ignores the per-row scale, so no dequantization is needed.
+  """
+  if simsimd is not None:
+    distances = simsimd.cdist(quantize_int8(embeddings), quantize_int8(embedding), metric="cosine")
+    return 1.0 - np.asarray(distances).mean()
+  embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+  embedding = np.ascontiguousarray(embedding, dtype=np.float32)
+  return (embeddings @ embedding).mean()
+
+def near_duplicate_representatives(posts, threshold=SEMANTIC_DUPLICATE_THRESHOLD, block=1024):
+  """For each post, the index of the first earlier post it near-duplicates (or itself).
+
+  Similarity is the dot product of the stored unit-length post embeddings,
+  computed a block of rows at a time; posts without an embedding, or with the
+  zero vector given to empty text, only match themselves.
+  """
+  representatives = list(range(len(posts)))
+  indices = [i for i, post in enumerate(posts) if post.get("embedding")]
+  if len(indices) < 2:
+    return representatives
+  X = np.stack([embedding_from_bson(posts[i]["embedding"]) for i in indices])
+  # Real embeddings are unit length; anything far shorter is a placeholder
+  keep = np.linalg.norm(X, axis=1) >= 0.5
+  indices = [i for i, k in zip(indices, keep) if k]
+  X = X[keep]
+  for start in range(0, len(indices), block):
+    similar = (X[start:start + block] @ X.T) >= threshold
+    for row, matches in enumerate(similar, start):
+      first = int(matches.argmax())
+      # matches[first] guards against a row matching nothing, not even itself
+      if matches[first] and first < row:
+        representatives[indices[row]] = representatives[indices[first]]
+  return representatives
+
+def shared_post_summarizer(posts):
+  """summarize_post for posts[i], with near-duplicate posts sharing one request."""
+  representatives = near_duplicate_representatives(posts)
+  requests = {}
+
+  async def summarize(i, post_text):
+    representative = representatives[i]
+    if representative not in requests:
+      requests[representative] = asyncio.ensure_future(summarize_post(post_text))
+    return await requests[representative]
+  return summarize
+
+async def create_insights(post_data):
+  sem = asyncio.Semaphore(POST_CONCURRENCY)
+  summarize = shared_post_summarizer(post_data)
+  # Every post's comments come from one query, run on a worker thread while
+  # the post summaries are already being requested
+  comments_task = asyncio.ensure_future(asyncio.to_thread(
+    dbManager.get_all_comments_for_posts, [post.get("id") for post in post_data]
+  ))
+
+  async def process_post(i, post):
+    async with sem:
+      post_id = post.get("id")
+      title = post.get("title")
+      selftext = post.get("selftext")
+      created_utc = post.get("created_utc")
+      score = post.get("score")
+      num_comments = post.get("num_comments")
+      author = post.get("author")
+      url = post.get("url")
+      embedding = post.get("embedding")
+      mention = {
+        "post_id": post_id,
+        "post_title": title,
+        "post_body": selftext,
+        "data_posted": created_utc,
+        "score": score,
+        "num_comments": num_comments,
+        "author": author,
+        "url": url,
+      }
+      post_text = f"{title}\n\n{selftext}"
+      post_summary = await summarize(i, post_text)
+      parsed_summary = parse_insights(post_summary)
+
+      post_comments = (await comments_task)[post_id]
+
+      comment_embeddings = [embedding_from_bson(comment["embedding"]) for comment in post_comments if comment.get("embedding")]
+      average_similarity = mean_cosine_similarity(comment_embeddings, embedding_from_bson(embedding)) if comment_embeddings else 0.0
+      #print(f"Average similarity between comments and post: {average_similarity:.4f}")
+
+      post_text = f"Post: {post_text}\n"
+      comments_text = join_comments(post_comments)
+      if content_length(comments_text) >= MIN_COMMENT_CHARS:
+        comments_summary = await summarize_comments(post_text + "Comments:\n" + comments_text)
+      else:
+        comments_summary = "N/A"
 
-    #print(f"Post Summary: {post_summary}")
-    #print(f"Comments Summary: {comments_summary}")
+      #print(f"Post Summary: {post_summary}")
+      #print(f"Comments Summary: {comments_summary}")
+      return mention, parsed_summary, comments_summary
+
+  # All posts are processed concurrently; gather keeps results in post order
+  results = await tqdm_asyncio.gather(*[process_post(i, post) for i, post in enumerate(post_data)])
+  mentions = [mention for mention, _, _ in results]
+  post_summaries = [parsed_summary for _, parsed_summary, _ in results]
+  post_comments_summaries = [comments_summary for _, _, comments_summary in results]
 
   return post_summaries, post_comments_summaries, mentions
 
-def group_similar_insights(insights, target_mentions=10):
-    """Group similar insights using embeddings (or OpenAI) to achieve target mention count"""
-    if len(insights) < 2:
-        return [insights]
+def join_comments(comments, max_chars=MAX_COMMENT_CHARS):
+  """Newline-join comment bodies, stopping before the text passes max_chars.
+
+  Deleted and removed comments are left out.
+  """
+  bodies = []
+  total = 0
+  for comment in comments:
+    body = comment.get("body", "")
+    if body in ("[deleted]", "[removed]"):
+      continue
+    if total + len(body) > max_chars:
+      break
+    bodies.append(body)
+    total += len(body) + 1
+  return "\n".join(bodies)
+
+def parse_insights(post_summary):
+  """The insight list from summarize_post's JSON reply ([] if it's malformed)."""
+  try:
+    insights = orjson.loads(post_summary)["insights"]
+  except (orjson.JSONDecodeError, KeyError, TypeError):
+    return []
+  if not isinstance(insights, list):
+    return []
+  return [insight for insight in insights if isinstance(insight, str)]
+
+def euclidean_distance_matrix(X):
+    """All pairwise euclidean distances of the rows of X, from a single Gram matrix product."""
+    X = np.asarray(X, dtype=np.float64)
+    sq_norms = np.einsum("ij,ij->i", X, X)
+    D = sq_norms[:, None] + sq_norms[None, :] - 2.0 * (X @ X.T)
+    np.maximum(D, 0, out=D)
+    np.fill_diagonal(D, 0)
+    return np.sqrt(D, out=D)
+
+def silhouette_from_distances(D, labels):
+    """
+    Silhouette score from a precomputed distance matrix.
+    
+    Per-cluster distance sums for every point are one (n, n) x (n, k) product,
+    so scoring another labelling of the same points costs O(n^2 k) and never
+    recomputes distances. Matches sklearn's silhouette_score.
+    """
+    _, labels = np.unique(labels, return_inverse=True)
+    n = len(labels)
+    rows = np.arange(n)
+    membership = np.zeros((n, labels.max() + 1))
+    membership[rows, labels] = 1
     
-    # Extract insight texts and create embeddings
-    embeddings = []
-    valid_insights = []
+    sums = D @ membership
+    counts = np.tile(membership.sum(axis=0), (n, 1))
+    counts[rows, labels] -= 1  # a point's distance to itself doesn't count
     
-    for i, insight in enumerate(insights):
-        # Generate embedding for the insight text
-        embedding = dbManager.generate_embedding(insight["insight"])
-        if embedding and len(embedding) == 384:
-            embeddings.append(embedding)
-            valid_insights.append(insight)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.where(counts > 0, sums / counts, np.inf)
+    a = means[rows, labels]
+    means[rows, labels] = np.inf
+    b = means.min(axis=1)
     
-    if len(embeddings) < 2:
+    # Points alone in their cluster score 0, as in sklearn
+    spread = np.maximum(a, b)
+    valid = np.isfinite(spread) & (spread > 0)
+    s = np.zeros(n)
+    s[valid] = (b[valid] - a[valid]) / spread[valid]
+    return float(s.mean())
+
+# Below this many insights the K sweep is skipped and K is picked from the counts
+MIN_INSIGHTS_FOR_K_SWEEP = 50
+
+def make_kmeans(k, n_samples):
+    """KMeans for k clusters: cuML's full-batch on the GPU, mini-batch on the CPU."""
+    if USE_GPU:
+        return KMeans(n_clusters=k, random_state=42, n_init=10)
+    return MiniBatchKMeans(n_clusters=k, random_state=42, batch_size=min(256, n_samples), n_init=3)
+
+def group_similar_insights(insights, target_mentions=10):
+    """Group similar insights using embeddings (or OpenAI) to achieve target mention count"""
+    if len(insights) < 2:
         return [insights]
     
-    embeddings_array = np.array(embeddings)
+    # Embed every insight text in one batched encode call; texts embedded in
+    # earlier runs come from the database manager's embedding cache
+    valid_insights = insights
+    embeddings_array = dbManager.generate_embeddings_batch([insight.insight for insight in insights])
     
     # Calculate target number of groups (aim for 8-12 mentions per group)
-    total_mentions = sum(insight["num_mentions"] for insight in valid_insights)
+    total_mentions = sum(insight.num_mentions for insight in valid_insights)
     target_groups = max(2, total_mentions // target_mentions)
     target_groups = min(target_groups, len(valid_insights) // 2)  # Don't over-cluster
     
     print(f"Grouping {len(valid_insights)} insights into ~{target_groups} groups (target: {target_mentions} mentions per group)")
     
-    # Test different K values
-    silhouette_scores = {}
-    for k in range(2, min(target_groups + 3, len(valid_insights) // 2)):
-        if k >= len(valid_insights):
-            break
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-        cluster_labels = kmeans.fit_predict(embeddings_array)
-        silhouette_avg = silhouette_score(embeddings_array, cluster_labels)
-        silhouette_scores[k] = silhouette_avg
+    # KMeans input lives on the GPU when cuML is in use
+    kmeans_input = cupy.asarray(embeddings_array) if USE_GPU else embeddings_array
     
-    # Choose best K
-    best_k = max(silhouette_scores.items(), key=lambda x: x[1])[0] if silhouette_scores else 2
-    best_k = max(2, min(best_k, target_groups))
+    labels_by_k = {}
+    if len(valid_insights) < MIN_INSIGHTS_FOR_K_SWEEP:
+        # Too few insights for silhouette scores to say much; cluster into
+        # about one group per three insights, capped at the target
+        best_k = max(2, min(target_groups, len(valid_insights) // 3))
+    else:
+        # Pairwise distances are computed once and reused to score every K
+        distances = euclidean_distance_matrix(embeddings_array)
+        
+        # Test different K values
+        silhouette_scores = {}
+        for k in range(2, min(target_groups + 3, len(valid_insights) // 2)):
+            if k >= len(valid_insights):
+                break
+            kmeans = make_kmeans(k, len(valid_insights))
+            cluster_labels = kmeans.fit_predict(kmeans_input)
+            if USE_GPU:
+                cluster_labels = cupy.asnumpy(cluster_labels)
+            silhouette_avg = silhouette_from_distances(distances, cluster_labels)
+            silhouette_scores[k] = silhouette_avg
+            labels_by_k[k] = cluster_labels
+        
+        # Choose best K
+        best_k = max(silhouette_scores.items(), key=lambda x: x[1])[0] if silhouette_scores else 2
+        best_k = max(2, min(best_k, target_groups))
     
     print(f"Using {best_k} groups for insight generalization")
     
-    # Final clustering
-    kmeans = KMeans(n_clusters=best_k, random_state=42, n_init=10)
-    cluster_labels = kmeans.fit_predict(embeddings_array)
+    # Final clustering (the sweep's fit is reused when it already tried best_k)
+    cluster_labels = labels_by_k.get(best_k)
+    if cluster_labels is None:
+        kmeans = make_kmeans(best_k, len(valid_insights))
+        cluster_labels = kmeans.fit_predict(kmeans_input)
+        if USE_GPU:
+            cluster_labels = cupy.asnumpy(cluster_labels)
     
     # Group insights by cluster
     groups = {}
@@ -144,10 +385,10 @@ async def generalize_insight_group(insight_group):
     
     for insight in insight_group:
         insight_data.append({
-            "insight": insight["insight"],
-            "mentions": insight["num_mentions"]
+            "insight": insight.insight,
+            "mentions": insight.num_mentions
         })
-        all_mentions.extend(insight["mentions"])
+        all_mentions.extend(insight.mentions)
     
     # Use OpenAI to generalize the insights
     try:
@@ -157,17 +398,17 @@ async def generalize_insight_group(insight_group):
             "insight": generalized_insight,
             "mentions": all_mentions,
             "num_mentions": len(all_mentions),
-            "original_insights": [insight["insight"] for insight in insight_group]
+            "original_insights": [insight.insight for insight in insight_group]
         }
     except Exception as e:
         print(f"Error generalizing insights: {e}")
         # Fallback: combine insights manually
-        combined_insight = " / ".join([insight["insight"] for insight in insight_group[:3]])
+        combined_insight = " / ".join([insight.insight for insight in insight_group[:3]])
         return {
             "insight": combined_insight,
             "mentions": all_mentions,
             "num_mentions": len(all_mentions),
-            "original_insights": [insight["insight"] for insight in insight_group]
+            "original_insights": [insight.insight for insight in insight_group]
         }
 
 async def get_insights_for_subreddit(subreddit):
@@ -217,50 +458,41 @@ async def get_insights_for_subreddit(subreddit):
 
 async def create_post_specific_insights(posts):
   """Create specific insights for each post and group similar ones immediately"""
-  all_insights = {}  # Dictionary to group insights by text
+  all_insights = {}  # Insight text -> PostInsight
+  sem = asyncio.Semaphore(POST_CONCURRENCY)
+  summarize_shared = shared_post_summarizer(posts)
+
+  async def summarize(i, post):
+    async with sem:
+      title = post.get("title")
+      selftext = post.get("selftext")
+      
+      mention = {
+        "post_id": post.get("id"),
+        "post_title": title,
+        "post_body": selftext,
+        "data_posted": post.get("created_utc"),
+        "score": post.get("score"),
+        "num_comments": post.get("num_comments"),
+        "author": post.get("author"),
+        "url": post.get("url"),
+      }
+      
+      post_text = f"{title}\n\n{selftext}"
+      return mention, await summarize_shared(i, post_text)
   
-  for post in tqdm(posts):
-    post_id = post.get("id")
-    title = post.get("title")
-    selftext = post.get("selftext")
-    subreddit = post.get("subreddit")
-    created_utc = post.get("created_utc")
-    score = post.get("score")
-    num_comments = post.get("num_comments")
-    author = post.get("author")
-    url = post.get("url")
-    
-    mention = {
-      "post_id": post_id,
-      "post_title": title,
-      "post_body": selftext,
-      "data_posted": created_utc,
-      "score": score,
-      "num_comments": num_comments,
-      "author": author,
-      "url": url,
-    }
-    
-    post_comments = dbManager.get_all_comments_for_post(post_id)
-    
-    post_text = f"{title}\n\n{selftext}"
-    post_summary = await summarize_post(post_text)
-    
-    try:
-      parsed_summary = ast.literal_eval(post_summary)
-      if isinstance(parsed_summary, list):
-        for summary in parsed_summary:
-          # Group insights by exact text match
-          if summary not in all_insights:
-            all_insights[summary] = {
-              "insight": summary,
-              "mentions": [],
-              "num_mentions": 0
-            }
-          all_insights[summary]["mentions"].append(mention)
-          all_insights[summary]["num_mentions"] += 1
-    except (ValueError, SyntaxError):
-      pass  # Skip invalid summaries
+  # Summaries are requested concurrently; gather keeps them in post order so
+  # each insight's mentions come out in the same order as before
+  results = await tqdm_asyncio.gather(*[summarize(i, post) for i, post in enumerate(posts)])
+  
+  for mention, post_summary in results:
+    # Invalid summaries parse to [] and are skipped
+    for summary in parse_insights(post_summary):
+      # Group insights by exact text match
+      post_insight = all_insights.get(summary)
+      if post_insight is None:
+        post_insight = all_insights[summary] = PostInsight(summary)
+      post_insight.mentions.append(mention)
   
   # Convert to list
   post_insights = list(all_insights.values())
@@ -281,7 +513,7 @@ async def generalize_insight_groups(insight_groups):
 
 def filter_raw_insights(raw_insights):
   user_scores = pd.read_parquet('../user_scores.parquet', engine="fastparquet")
-  bot_users = user_scores[user_scores['score'] > 0.5]['username'].tolist()
+  bot_users = frozenset(user_scores.loc[user_scores['score'] > 0.5, 'username'])
 
   filtered_insights = []
   
@@ -294,10 +526,8 @@ def filter_raw_insights(raw_insights):
       "original_insights": insight.get("original_insights", [])
     }
     
-    # Filter mentions
-    for mention in insight['mentions']:
-      if mention['author'] not in bot_users:
-        filtered_insight['mentions'].append(mention)
+    # Filter mentions (set lookup per author)
+    filtered_insight['mentions'] = [mention for mention in insight['mentions'] if mention['author'] not in bot_users]
     
     # Update mention count
     filtered_insight['num_mentions'] = len(filtered_insight['mentions'])
@@ -0,0 +1,58 @@
+import functools
+import hashlib
+import json
+import sqlite3
+import time
+
+# OpenAI responses persisted across runs, keyed by a hash of the prompt input,
+# so rerunning insight creation over unchanged posts skips the API calls
+INSIGHT_CACHE_PATH = "insightcache.db"
+_insight_cache_conn = None
+
+
+def _insight_cache():
+  global _insight_cache_conn
+  if _insight_cache_conn is None:
+    _insight_cache_conn = sqlite3.connect(INSIGHT_CACHE_PATH)
+    _insight_cache_conn.execute(
+      "CREATE TABLE IF NOT EXISTS responses ("
+      "key TEXT PRIMARY KEY, value TEXT, created_at REAL)"
+    )
+  return _insight_cache_conn
+
+
+def cache_key(namespace, version, payload):
+  """SHA-256 of the namespace, model/version and JSON-encoded input."""
+  data = json.dumps([namespace, version, payload], sort_keys=True, ensure_ascii=False)
+  return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def cached(namespace, version, ttl=None, skip=()):
+  """Cache an async function's JSON-serializable result on disk.
+
+  The key covers the arguments plus `version` (e.g. the model name), so a
+  model change starts a fresh cache. Results older than `ttl` seconds are
+  recomputed, and results in `skip` (error fallbacks) are never stored.
+  """
+  def decorator(func):
+    @functools.wraps(func)
+    async def wrapper(*args):
+      key = cache_key(namespace, version, args)
+      row = _insight_cache().execute(
+        "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+      ).fetchone()
+      if row is not None and (ttl is None or time.time() - row[1] < ttl):
+        return json.loads(row[0])
+
+      result = await func(*args)
+      if result not in skip:
+        conn = _insight_cache()
+        conn.execute(
+          "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+          (key, json.dumps(result), time.time()),
+        )
+        conn.commit()
+      return result
+    return wrapper
+  return decorator
+
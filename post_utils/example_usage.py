@@ -1,24 +1,21 @@
 from json_cleaning import (
-    load_json, save_json, compute_empty_ratios, suggest_features_to_remove, clean_json
+    iter_json_items, compute_empty_ratios, suggest_features_to_remove, clean_json_file
 )
 
 def main():
     # Load the JSON data from a file
     input_file = "comment_example.json"
     output_file = "reddit_cleaned.json"
-    data = load_json(input_file)
 
-    # Compute empty ratios for features
-    empty_ratios = compute_empty_ratios(data)
+    # Compute empty ratios for features (streamed, one listing at a time)
+    empty_ratios = compute_empty_ratios(iter_json_items(input_file))
 
     # Suggest features to remove based on empty ratios
     features_to_remove = suggest_features_to_remove(empty_ratios, threshold=0.8)
 
-    # Clean the JSON data by removing unwanted fields
-    cleaned_data = clean_json(data, features_to_remove)
-
-    # Save the cleaned JSON data to a file
-    save_json(cleaned_data, output_file)
+    # Clean the JSON data by removing unwanted fields and save it, streaming
+    # the input again so the whole file is never held in memory
+    clean_json_file(input_file, output_file, features_to_remove)
 
     print(f"Cleaned data saved to {output_file}")
 
@@ -5,15 +5,18 @@ import os
 import json
 import argparse
 import logging
+import threading
 import time
 from datetime import datetime, timezone, timedelta
 from typing import List, Dict, Optional
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
+import numpy as np
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 # Add the parent directory to the path to import database
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_utils.database import RedditDataManager
+from db_utils.database import EMBED_BATCH_SIZE, MAX_EMBED_CHARS, RedditDataManager, embedding_to_bson, load_embedding_model
 
 load_dotenv()
 
@@ -21,29 +24,105 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-reddit = praw.Reddit(
-  client_id=os.getenv("CLIENT_ID"),
-  client_secret=os.getenv("CLIENT_SECRET"),
-  user_agent="my_reddit_app:v1.0 (by u/SilveerDusk)"
-)
+# Comment threads are fetched on a small thread pool; Reddit's per-client
+# rate limit makes more workers pointless
+COMMENT_FETCH_WORKERS = 4
+
+_thread_local = threading.local()
+
+def _pooled_retrying_adapter():
+    # Keep connections alive across requests and retry rate limits / server
+    # errors with exponential backoff, honouring Retry-After (GET only, so
+    # nothing is ever submitted twice)
+    retry = Retry(
+        total=5,
+        backoff_factor=1.0,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    return HTTPAdapter(pool_connections=COMMENT_FETCH_WORKERS, pool_maxsize=COMMENT_FETCH_WORKERS, max_retries=retry)
+
+def get_reddit():
+    """Return this thread's PRAW client (PRAW isn't thread-safe), creating it on first use."""
+    client = getattr(_thread_local, "reddit", None)
+    if client is None:
+        client = praw.Reddit(
+          client_id=os.getenv("CLIENT_ID"),
+          client_secret=os.getenv("CLIENT_SECRET"),
+          user_agent="my_reddit_app:v1.0 (by u/SilveerDusk)"
+        )
+        # prawcore sends everything through this requests.Session
+        client._core._requestor._http.mount("https://", _pooled_retrying_adapter())
+        _thread_local.reddit = client
+    return client
+
+reddit = get_reddit()
+
+def _prepare_texts(posts: List[Dict]) -> List[str]:
+    """Embedding input for each post: title and selftext, truncated and stripped"""
+    return [
+        (post.get("title", "") + " " + post.get("selftext", ""))[:MAX_EMBED_CHARS].strip()
+        for post in posts
+    ]
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+    
+    Allows bursts of up to `capacity` requests and `rate` requests per second
+    on average; acquire() blocks until a token is available.
+    """
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Take one token, waiting for the bucket to refill if it is empty"""
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                time.sleep((1 - self.tokens) / self.rate)
+    
+    def update_from_limits(self, remaining: Optional[float], reset_timestamp: Optional[float]):
+        """Spread the requests Reddit says are left evenly over the rest of its window"""
+        if remaining is None or reset_timestamp is None:
+            return
+        seconds_left = max(reset_timestamp - time.time(), 1.0)
+        with self.lock:
+            self.rate = max(remaining, 1) / seconds_left
 
 class RedditCaller:
     """
     Reddit data fetcher and processor with embedding generation and MongoDB insertion.
     """
     
-    def __init__(self):
-        """Initialize database connection and embedding model"""
-        self.db_manager = RedditDataManager()
+    def __init__(self, device: Optional[str] = None):
+        """
+        Initialize database connection and embedding model.
+        
+        Args:
+            device (Optional[str]): Torch device for the embedding model; defaults to CUDA when available
+        """
+        self.db_manager = RedditDataManager(device)
+        # Starts at Reddit's 60 requests/minute and adapts to its rate-limit headers
+        self.limiter = TokenBucket(rate=1.0, capacity=5)
         self.embedding_model = None
-        self._load_embedding_model()
+        self._load_embedding_model(device)
     
-    def _load_embedding_model(self):
+    def _load_embedding_model(self, device: Optional[str] = None):
         """Load the sentence transformer model for embeddings"""
         try:
-            logger.info("Loading embedding model...")
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-            logger.info("Embedding model loaded successfully")
+            # Same process-wide model the database manager uses
+            self.embedding_model = load_embedding_model(device)
         except Exception as e:
             logger.error(f"Failed to load embedding model: {e}")
             raise
@@ -56,8 +135,10 @@ class RedditCaller:
     def fetch_posts(self, subreddit, limit=100, after=None):
         """Fetch latest posts from a subreddit."""
         posts = []
+        last = None
 
-        for submission in subreddit.new(limit=limit, params={"after": None}):
+        for submission in subreddit.new(limit=limit, params={"after": after}):
+            last = submission.name
             post_id = submission.id
             post_title = submission.title
             post_creator = submission.created_utc
@@ -82,12 +163,16 @@ class RedditCaller:
                 "stickied": stickied
             })
 
-        return posts, submission.name  # return 'after' for pagination
+        return posts, last  # return 'after' for pagination (None once the listing runs out)
 
     def fetch_comments(self, post_id):
-        """Fetch comments for a given post ID."""
-        submission = reddit.submission(id=post_id)
+        """Fetch comments for a given post ID (safe to call from worker threads)."""
+        self.limiter.acquire()
+        client = get_reddit()
+        submission = client.submission(id=post_id)
         submission.comments.replace_more(limit=0)
+        limits = client.auth.limits
+        self.limiter.update_from_limits(limits.get("remaining"), limits.get("reset_timestamp"))
         comments = []
 
         for comment in submission.comments.list():
@@ -113,13 +198,17 @@ class RedditCaller:
 
         return comments
 
-    def fetch_subreddit_posts(self, subreddit_name="uberdrivers", number_of_posts=100):
+    def fetch_subreddit_posts(self, subreddit_name="uberdrivers", number_of_posts=100, include_stickied=False):
         """
         Fetch posts from a subreddit with pagination support.
         
+        Each post is returned once, even if it shows up on more than one page.
+        
         Args:
             subreddit_name (str): Name of the subreddit to fetch posts from
             number_of_posts (int): Number of posts to fetch
+            include_stickied (bool): Keep stickied (pinned) posts, which are
+                mod announcements rather than discussion
             
         Returns:
             list: List of post dictionaries
@@ -127,13 +216,18 @@ class RedditCaller:
         batches = (number_of_posts + 99) // 100
         subreddit = reddit.subreddit(subreddit_name)
         posts = []
+        seen_ids = set()
         after = None
         
         print(f"Fetching {number_of_posts} posts from r/{subreddit_name}...")
         
         for _ in range(batches):
             posts_batch, after = self.fetch_posts(subreddit, limit=100, after=after)
-            posts.extend(posts_batch)
+            for post in posts_batch:
+                if post["id"] in seen_ids or (post["stickied"] and not include_stickied):
+                    continue
+                seen_ids.add(post["id"])
+                posts.append(post)
             if not after:
                 break
                 
@@ -141,74 +235,52 @@ class RedditCaller:
 
         return posts
     
+    def generate_embeddings_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate embeddings for many texts with a single encode call.
+        
+        Args:
+            texts (List[str]): Texts to embed; empty ones get the zero vector
+            
+        Returns:
+            np.ndarray: float32 array of shape (len(texts), 384)
+        """
+        return self.db_manager.generate_embeddings_batch(texts)
+    
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for text using sentence transformers"""
-        try:
-            if not text or text.strip() == "":
-                return [0.0] * 384  # Return zero vector for empty text
-            
-            # Truncate very long texts to avoid memory issues
-            if len(text) > 1000:
-                text = text[:1000]
-            
-            embedding = self.embedding_model.encode(text)
-            return embedding.tolist()
-            
-        except Exception as e:
-            logger.error(f"Failed to generate embedding: {e}")
-            return [0.0] * 384
+        return self.generate_embeddings_batch([text])[0].tolist()
+    
+    def process_posts(self, posts: List[Dict]) -> List[Dict]:
+        """Process many posts: embeddings (title + selftext) are generated in one batch"""
+        embeddings = self.generate_embeddings_batch(_prepare_texts(posts))
+        # fetch_posts already built the full document, so the embedding is added in place
+        for post, embedding in zip(posts, embeddings):
+            post["embedding"] = embedding_to_bson(embedding)
+        return posts
+    
+    def process_comments(self, comments: List[Dict]) -> List[Dict]:
+        """Process many comments: embeddings (body) are generated in one batch"""
+        embeddings = self.generate_embeddings_batch([comment.get("body", "") for comment in comments])
+        # fetch_comments already built the full document, so the embedding is added in place
+        for comment, embedding in zip(comments, embeddings):
+            comment["embedding"] = embedding_to_bson(embedding)
+        return comments
     
     def process_post(self, post_data: Dict) -> Dict:
-        """Process a single post: add metadata and generate embedding"""
+        """Process a single post in place: add its embedding"""
         try:
-            # Generate embedding for post (title + selftext)
-            post_text = f"{post_data.get('title', '')} {post_data.get('selftext', '')}".strip()
-            embedding = self.generate_embedding(post_text)
-            
-            # Add required fields and metadata
-            processed_post = {
-                "id": post_data.get("id"),
-                "title": post_data.get("title", ""),
-                "selftext": post_data.get("selftext", ""),
-                "subreddit": post_data.get("subreddit", ""),
-                "created_utc": post_data.get("created_utc"),
-                "score": post_data.get("score", 0),
-                "num_comments": post_data.get("num_comments", 0),
-                "author": post_data.get("author", ""),
-                "url": post_data.get("url", ""),
-                "stickied": post_data.get("stickied", False),
-                "embedding": embedding
-            }
-            
-            return processed_post
-            
+            return self.process_posts([post_data])[0]
         except Exception as e:
             logger.error(f"Failed to process post {post_data.get('id', 'unknown')}: {e}")
             raise
     
     def process_comment(self, comment_data: Dict) -> Dict:
-        """Process a single comment: add metadata and generate embedding"""
+        """Process a single comment in place: add its embedding"""
         try:
-            # Generate embedding for comment body
-            comment_text = comment_data.get("body", "")
-            embedding = self.generate_embedding(comment_text)
-            
-            # Add required fields and metadata
-            processed_comment = {
-                "id": comment_data.get("id"),
-                "body": comment_data.get("body", ""),
-                "post_id": comment_data.get("post_id"),
-                "created_utc": comment_data.get("created_utc"),
-                "score": comment_data.get("score", 0),
-                "author": comment_data.get("author", ""),
-                "is_submitter": comment_data.get("is_submitter", False),
-                "embedding": embedding
-            }
-            
-            return processed_comment
-            
+            return self.process_comments([comment_data])[0]
         except Exception as e:
             logger.error(f"Failed to process comment {comment_data.get('id', 'unknown')}: {e}")
             raise
 
-__all__ = ['RedditCaller']
\ No newline at end of file
+__all__ = ['RedditCaller', 'COMMENT_FETCH_WORKERS', 'EMBED_BATCH_SIZE']
\ No newline at end of file
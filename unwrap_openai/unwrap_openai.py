@@ -5,9 +5,21 @@
 
 
 import asyncio
+import functools
+import json
 import os
+import random
+import re
 from typing import List, Dict, Optional, Any
-from openai import AsyncAzureOpenAI, pydantic_function_tool
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncAzureOpenAI,
+    InternalServerError,
+    OpenAIError,
+    RateLimitError,
+    pydantic_function_tool,
+)
 from openai.types.chat import ChatCompletion
 from pydantic import BaseModel, Field
 from enum import Enum
@@ -36,8 +48,72 @@ class ReasoningEffort(str, Enum):
 
 subscription_key = os.getenv("SUBSCRIPTION_KEY")
 
-# Semaphore to limit concurrent OpenAI calls to 20
-_openai_semaphore = asyncio.Semaphore(20)
+# Concurrent OpenAI calls; requests are I/O bound, so this can sit well above
+# the CPU count and Azure's 429s (handled below) are the real limit
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "100"))
+_openai_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+# Attempts per call when Azure answers 429 Too Many Requests, or the request
+# fails transiently (timeout, dropped connection, 5xx)
+OPENAI_MAX_ATTEMPTS = 6
+TRANSIENT_ERRORS = (APITimeoutError, APIConnectionError, InternalServerError)
+# Loop time before which no new request is sent. A 429 pushes this out for
+# every caller, so the whole pool backs off instead of each task retrying into
+# the same limit
+_rate_limited_until = 0.0
+
+# Text with fewer letters/digits than this, once links and [deleted]/[removed]
+# markers are dropped, isn't worth a completion (e.g. an empty body, a bare
+# link or a lone emoji)
+MIN_POST_CHARS = 5
+_NON_CONTENT_RE = re.compile(r"https?://\S+|www\.\S+|\[(?:deleted|removed)\]")
+
+# One client (and so one pool of keep-alive HTTPS connections) for every call
+_client: Optional[AsyncAzureOpenAI] = None
+
+
+def _retry_after(error: RateLimitError, attempt: int) -> float:
+    """Seconds to wait after a 429: the server's Retry-After, else exponential, plus jitter."""
+    headers = error.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            delay = float(headers["retry-after-ms"]) / 1000
+        else:
+            delay = float(headers["retry-after"])
+    except (KeyError, ValueError):
+        delay = _backoff(attempt)
+    return delay + random.uniform(0, 1)
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter, capped at 30 seconds."""
+    return random.uniform(0, min(2 ** attempt, 30))
+
+
+def content_length(text: Optional[str]) -> int:
+    """Letters and digits in text, not counting links or [deleted]/[removed] markers."""
+    return sum(c.isalnum() for c in _NON_CONTENT_RE.sub("", text or ""))
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_tool(tool: type[BaseModel]) -> Dict[str, Any]:
+    """Tool definition for a Pydantic model, built once per model class."""
+    return pydantic_function_tool(tool)
+
+
+def get_openai_client() -> AsyncAzureOpenAI:
+    """Shared Azure OpenAI client, created on first use (it needs SUBSCRIPTION_KEY)."""
+    global _client
+    if _client is None:
+        _client = AsyncAzureOpenAI(
+            api_version="2024-12-01-preview",
+            azure_endpoint=endpoint,
+            api_key=subscription_key,
+            timeout=60.0,
+            # Retries happen in create_openai_completion, shared across calls
+            max_retries=0,
+        )
+    return _client
 
 
 async def create_openai_completion(
@@ -47,11 +123,17 @@ async def create_openai_completion(
     max_completion_tokens: int = 16384,
     tools: Optional[List[type[BaseModel]]] = None,
     tool_choice: Optional[str | Dict[str, Any]] = None,
+    response_format: Optional[Dict[str, Any]] = None,
     client: Optional[AsyncAzureOpenAI] = None,
 ) -> ChatCompletion:
     """
     Primary OpenAI call function that uses a semaphore to limit concurrency.
 
+    Rate-limited (429) calls are retried after the server's Retry-After delay,
+    and every other call waits out that delay too. Timeouts, connection errors
+    and 5xx responses are retried with exponential backoff; other errors
+    (e.g. 400 Bad Request) are raised immediately.
+
     Args:
         messages: List of message dictionaries with 'role' and 'content' keys
         model: GPT model deployment to use
@@ -59,39 +141,54 @@ async def create_openai_completion(
         max_completion_tokens: Maximum tokens in completion
         tools: Optional list of Pydantic BaseModel classes to use as tools
         tool_choice: Optional tool choice control ("auto", "none", "required", or specific tool dict)
-        client: Optional pre-configured client, creates new one if None
+        response_format: Optional output format, e.g. {"type": "json_object"} for JSON mode
+        client: Optional pre-configured client, uses the shared one if None
 
     Returns:
         ChatCompletion response from OpenAI
     """
-    async with _openai_semaphore:
-        if client is None:
-            client = AsyncAzureOpenAI(
-                api_version="2024-12-01-preview",
-                azure_endpoint=endpoint,
-                api_key=subscription_key,
-            )
-
-        openai_tools = None
-        if tools:
-            openai_tools = [pydantic_function_tool(tool) for tool in tools]
-
-        request_params = {
-            "messages": messages,
-            "max_completion_tokens": max_completion_tokens,
-            "model": model.value,
-            "reasoning_effort": reasoning_effort,
-        }
-
-        if openai_tools:
-            request_params["tools"] = openai_tools
-
-            if tool_choice is not None:
-                request_params["tool_choice"] = tool_choice
-
-        response = await client.chat.completions.create(**request_params)
-
-        return response
+    global _rate_limited_until
+    if client is None:
+        client = get_openai_client()
+
+    openai_tools = None
+    if tools:
+        openai_tools = [_compile_tool(tool) for tool in tools]
+
+    request_params = {
+        "messages": messages,
+        "max_completion_tokens": max_completion_tokens,
+        "model": model.value,
+        "reasoning_effort": reasoning_effort,
+    }
+
+    if response_format is not None:
+        request_params["response_format"] = response_format
+
+    if openai_tools:
+        request_params["tools"] = openai_tools
+
+        if tool_choice is not None:
+            request_params["tool_choice"] = tool_choice
+
+    loop = asyncio.get_running_loop()
+    for attempt in range(OPENAI_MAX_ATTEMPTS):
+        async with _openai_semaphore:
+            delay = _rate_limited_until - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                return await client.chat.completions.create(**request_params)
+            except RateLimitError as e:
+                if attempt == OPENAI_MAX_ATTEMPTS - 1:
+                    raise
+                _rate_limited_until = max(_rate_limited_until, loop.time() + _retry_after(e, attempt))
+                continue
+            except TRANSIENT_ERRORS:
+                if attempt == OPENAI_MAX_ATTEMPTS - 1:
+                    raise
+        # Waits outside the semaphore so the slot goes to another call meanwhile
+        await asyncio.sleep(_backoff(attempt))
 
 
 # Example Pydantic tool model
@@ -247,15 +344,47 @@ async def example_disabled_tools() -> None:
         f"Tool calls made: {len(response_no_tools.choices[0].message.tool_calls or [])}"
     )
 
+# System prompts are kept as fixed module constants, with everything that varies
+# per call in the user message, so every request starts with an identical
+# prefix that Azure OpenAI's prompt cache can reuse
+SUMMARIZE_POST_PROMPT = "You are a helpful assistant, who objectively summarizes a string of inputted text into the singular topic or a couple of topics of the text in under 3 words. Respond with a JSON object of the form {\"insights\": [...]}.\n\n Example: Advice for renting a vehicle to drive in the Orlando area\nHello everyone, I’ve been driving for Uber in the Orlando area, mostly (Disney and Universal), for a few months using my personal vehicle. I typically drive in the evenings to avoid dealing with to much traffic. My question is has anyone rented a vehicle through Ubers marketplace and is it worth it? I have been on the fence as I do enjoy driving but hate the wear and tear on my personal vehicle. It does however seem very costly to rent and my concern is I will be driving to only afford to keep the rental each week and not actually make money. I understand driving just in the evenings likely won’t be enough but it seems everytime I have tried to driving during the day I make very little due to traffic.\nOne other question I have is it worth renting an electric vehicle? How many hours can you actually drive on a single charge? It seems like having to find a charging station and wait for it to charge would be extremely annoying, costly and time consuming?\nThanks for the advice. Output: {\"insights\": [\"Renting a vehicle\", \"Driver Question\", \"Orlando Area\"]}"
+
+SUMMARIZE_COMMENTS_PROMPT = "You are a helpful assistant, who objectively compares a posts text to the array of comments on the post and provides a one word sentiment analysis of whether the comments are typically agree, disagree, or neutral towards the post content.\n\n Example: Post: cancelling rides gets rid of surge now?\nis this market dependent? in north NJ and I just lost my surge by accepting and canceling a ride, never has this been the case before.\n\nComments: [\"I noticed that too. I accepted a ride in a 1.8x surge area and then canceled it, and the surge disappeared for me as well.\", \"Yeah, I think it's a new tactic Uber is using to prevent drivers from gaming the system. Kinda annoying though.\", \"I haven't experienced this yet, but it makes sense. Uber wants to ensure that drivers are actually completing rides during surge pricing.\", \"This is frustrating. I rely on surge pricing to make decent money during peak hours, and now it feels like a gamble every time I accept a ride.\", \"I wonder if this is just a temporary glitch or if Uber has officially changed their policy on surge pricing.\", \"I've been driving for a while and haven't seen this happen before. It could be specific to certain areas or times.\", \"It's possible that Uber is trying to discourage drivers from accepting rides just for the surge and then canceling them. Makes sense from their perspective.\", \"I think it's important for drivers to be aware of this change so they can adjust their strategies accordingly.\", \"Has anyone else experienced this in different cities or is it just happening in NJ?\", \"Overall, it seems like Uber is tightening their rules around surge pricing to ensure fairness for both drivers and riders.\"]\n\nOutput: Agree"
+
+SUMMARIZE_POSTS_BATCH_PROMPT = "You are a helpful assistant, who objectively summarizes each of several numbered posts into the singular topic or a couple of topics of that post in under 3 words each. Summarize every post independently. Respond with a JSON object of the form {\"results\": [{\"post\": 1, \"insights\": [...]}, ...]} with exactly one entry per post.\n\n Example: Post 1:\nAdvice for renting a vehicle to drive in the Orlando area\nHas anyone rented a vehicle through Ubers marketplace and is it worth it? It seems very costly to rent and my concern is I will be driving only to afford the rental each week.\n\nPost 2:\ncancelling rides gets rid of surge now?\nis this market dependent? in north NJ and I just lost my surge by accepting and canceling a ride.\n\nOutput: {\"results\": [{\"post\": 1, \"insights\": [\"Renting a vehicle\", \"Driver Question\", \"Orlando Area\"]}, {\"post\": 2, \"insights\": [\"Surge pricing\", \"Ride cancellation\"]}]}"
+
+GENERALIZE_INSIGHTS_PROMPT = """You are an expert at analyzing Reddit discussion patterns and creating broader insights.
+
+Given a list of similar insights with their mention counts, create ONE generalized insight that:
+1. Captures the common theme across all insights
+2. Is broader and more general than the individual insights
+3. Is 3-8 words maximum
+4. Uses general terms that would apply to similar discussions
+5. Focuses on the main topic/theme, not specific details
+
+Examples of good generalized insights:
+- "Driver earnings and pay rates"
+- "Vehicle maintenance and repairs"
+- "Passenger behavior complaints"
+- "App technical issues"
+- "Work schedule and hours"
+- "Safety concerns and incidents"
+- "Ride cancellation problems"
+- "Market saturation concerns"
+
+Return only the generalized insight text, nothing else."""
+
 async def summarize_post(post_content) -> None:
     """Example of basic chat completion without tools."""
+    if content_length(post_content) < MIN_POST_CHARS:
+        return '{"insights": []}'
 
     try:
 
         messages = [
             {
                 "role": "system",
-                "content": "You are a helpful assistant, who objectively summarizes a string of inputted text into an array containing the singular topic or a couple of topics of the text in under 3 words.\n\n Example: Advice for renting a vehicle to drive in the Orlando area\nHello everyone, I’ve been driving for Uber in the Orlando area, mostly (Disney and Universal), for a few months using my personal vehicle. I typically drive in the evenings to avoid dealing with to much traffic. My question is has anyone rented a vehicle through Ubers marketplace and is it worth it? I have been on the fence as I do enjoy driving but hate the wear and tear on my personal vehicle. It does however seem very costly to rent and my concern is I will be driving to only afford to keep the rental each week and not actually make money. I understand driving just in the evenings likely won’t be enough but it seems everytime I have tried to driving during the day I make very little due to traffic.\nOne other question I have is it worth renting an electric vehicle? How many hours can you actually drive on a single charge? It seems like having to find a charging station and wait for it to charge would be extremely annoying, costly and time consuming?\nThanks for the advice. Output: [Renting a vehicle, Driver Question, Orlando Area]",
+                "content": SUMMARIZE_POST_PROMPT,
             },
             {
                 "role": "user",
@@ -263,20 +392,64 @@ async def summarize_post(post_content) -> None:
             },
         ]
 
-        response = await create_openai_completion(messages)
+        response = await create_openai_completion(messages, response_format={"type": "json_object"})
         return response.choices[0].message.content
     
-    except:
-        return "[]"
+    except OpenAIError as e:
+        print(f"[WARN] Post summary failed: {e}")
+        return '{"insights": []}'
     
 
+async def summarize_posts_batch(posts: List[str]) -> List[str]:
+    """
+    Summarize several posts with one completion.
+
+    Returns one '{"insights": [...]}' JSON string per post, in order (the same
+    shape summarize_post returns); a post the reply leaves out, or that has
+    too little text to be worth sending, gets '{"insights": []}'.
+    """
+    results = ['{"insights": []}'] * len(posts)
+    # Positions in posts of the ones actually sent, numbered from 1 in the prompt
+    sent = [i for i, post in enumerate(posts) if content_length(post) >= MIN_POST_CHARS]
+    if not sent:
+        return results
+    try:
+        numbered = "\n\n".join(f"Post {n}:\n{posts[i]}" for n, i in enumerate(sent, 1))
+        messages = [
+            {
+                "role": "system",
+                "content": SUMMARIZE_POSTS_BATCH_PROMPT,
+            },
+            {
+                "role": "user",
+                "content": f"Please summarize each of the following {len(sent)} posts:\n\n{numbered}",
+            },
+        ]
+
+        response = await create_openai_completion(messages, response_format={"type": "json_object"})
+        reply = json.loads(response.choices[0].message.content or "")
+    except (OpenAIError, ValueError) as e:
+        print(f"[WARN] Batch summary of {len(sent)} posts failed: {e}")
+        return results
+
+    entries = reply.get("results") if isinstance(reply, dict) else None
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        index = entry.get("post")
+        insights = entry.get("insights")
+        if isinstance(index, int) and 1 <= index <= len(sent) and isinstance(insights, list):
+            results[sent[index - 1]] = json.dumps({"insights": [i for i in insights if isinstance(i, str)]})
+    return results
+
+
 async def summarize_comments(text) -> None:
     """Example of basic chat completion without tools."""
     try:
         messages = [
             {
                 "role": "system",
-                "content": "You are a helpful assistant, who objectively compares a posts text to the array of comments on the post and provides a one word sentiment analysis of whether the comments are typically agree, disagree, or neutral towards the post content.\n\n Example: Post: cancelling rides gets rid of surge now?\nis this market dependent? in north NJ and I just lost my surge by accepting and canceling a ride, never has this been the case before.\n\nComments: [\"I noticed that too. I accepted a ride in a 1.8x surge area and then canceled it, and the surge disappeared for me as well.\", \"Yeah, I think it's a new tactic Uber is using to prevent drivers from gaming the system. Kinda annoying though.\", \"I haven't experienced this yet, but it makes sense. Uber wants to ensure that drivers are actually completing rides during surge pricing.\", \"This is frustrating. I rely on surge pricing to make decent money during peak hours, and now it feels like a gamble every time I accept a ride.\", \"I wonder if this is just a temporary glitch or if Uber has officially changed their policy on surge pricing.\", \"I've been driving for a while and haven't seen this happen before. It could be specific to certain areas or times.\", \"It's possible that Uber is trying to discourage drivers from accepting rides just for the surge and then canceling them. Makes sense from their perspective.\", \"I think it's important for drivers to be aware of this change so they can adjust their strategies accordingly.\", \"Has anyone else experienced this in different cities or is it just happening in NJ?\", \"Overall, it seems like Uber is tightening their rules around surge pricing to ensure fairness for both drivers and riders.\"]\n\nOutput: Agree",
+                "content": SUMMARIZE_COMMENTS_PROMPT,
             },
             {
                 "role": "user",
@@ -286,7 +459,8 @@ async def summarize_comments(text) -> None:
 
         response = await create_openai_completion(messages)
         return response.choices[0].message.content
-    except:
+    except OpenAIError as e:
+        print(f"[WARN] Comment summary failed: {e}")
         return "N/A"
 
 async def generalize_insights(insight_data):
@@ -294,26 +468,7 @@ async def generalize_insights(insight_data):
     messages = [
         {
             "role": "system",
-            "content": """You are an expert at analyzing Reddit discussion patterns and creating broader insights.
-            
-            Given a list of similar insights with their mention counts, create ONE generalized insight that:
-            1. Captures the common theme across all insights
-            2. Is broader and more general than the individual insights
-            3. Is 3-8 words maximum
-            4. Uses general terms that would apply to similar discussions
-            5. Focuses on the main topic/theme, not specific details
-            
-            Examples of good generalized insights:
-            - "Driver earnings and pay rates"
-            - "Vehicle maintenance and repairs"
-            - "Passenger behavior complaints"
-            - "App technical issues"
-            - "Work schedule and hours"
-            - "Safety concerns and incidents"
-            - "Ride cancellation problems"
-            - "Market saturation concerns"
-            
-            Return only the generalized insight text, nothing else."""
+            "content": GENERALIZE_INSIGHTS_PROMPT,
         },
         {
             "role": "user",